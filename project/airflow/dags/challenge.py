@@ -45,51 +45,40 @@ is to be the target for all further processing and being the connection point fo
 That way, if there's a data source migration in the future, this stage can behave as a valve to which data stream
 goes to the reports, making sure the Data Engineers can control the flow and make adjustments if necessary without
 any extra work from our stakeholders downstream.
+
+### Serving export
+After the reports are updated, they're snapshotted into a local serving cache, versioned by the execution date,
+so that lookups of a single user (e.g. by dashboards or other services) take milliseconds instead of a warehouse query.
 """
 
 import datetime
 from pathlib import Path
 
 from airflow import DAG
+from airflow.models.param import Param
 from airflow.operators.empty import EmptyOperator
-from airflow.operators.python import PythonOperator
-from airflow.providers.google.cloud.transfers.local_to_gcs import LocalFilesystemToGCSOperator
-from airflow.providers.google.cloud.transfers.gcs_to_bigquery import GCSToBigQueryOperator
 from airflow.utils.task_group import TaskGroup
 
-from custom_operators.dbt import DBTRunOperator
-from scripts.generate_raw_data import generate_raw_data, remove_files
-
-class TablesAux:
-
-    def __init__(self, name: str):
-        self.name = name
-
-        self.pre_loading_upload_gcs_task = None
-        self.pre_loading_remove_local_task = None
-        self.landing_task = None
-        self.source_task = None
+from custom_operators.bigquery import LoadRawTableToBigQueryOperator
+from custom_operators.dbt import DBTBatchedTestOperator
+from custom_operators.dbt_graph import create_dbt_task_groups, get_leaf_tasks, load_dbt_graph
+from custom_operators.gcs import DAILY_TIME_OF_DAY, GenerateRawDataToGCSOperator
+from custom_operators.metrics import create_critical_path_report_task
+from custom_operators.serving import ExportReportsToServingCacheOperator
 
-    def create_dependencies(self):
-        (
-            self.pre_loading_upload_gcs_task
-            >> self.pre_loading_remove_local_task
-            >> self.landing_task
-            >> self.source_task
-        )
 
+RAW_TABLES = ['users', 'user_preferences', 'transactions']
 
-RAW_TABLES = {
-    'users': TablesAux('users'),
-    'user_preferences': TablesAux('user_preferences'),
-    'transactions': TablesAux('transactions'),
-}
+# The dbt models and their dependencies are read from the compiled dbt manifest,
+# so the levels 2 to 5 never need to be edited here when models are added or changed.
+DBT_GRAPH = load_dbt_graph()
 
 
 with DAG(
     dag_id=Path(__file__).stem,
     dag_display_name="Ancient Challenge",
     start_date=datetime.datetime(2024, 12, 11),
+    # Must match DAILY_TIME_OF_DAY, so manual runs and backfills generate the same data as the scheduled runs
     schedule="0 6 * * *",
     description="This DAG handles the ELT proccess for the challenge",
     doc_md=__doc__,
@@ -97,148 +86,65 @@ with DAG(
     # the amount of concurrent tasks needs to be limited.
     max_active_runs=1,
     max_active_tasks=2,
-):
+    params={
+        # Rebuilds the incremental models from the whole history instead of only the current ds
+        'full_refresh': Param(False, type='boolean'),
+    },
+) as dag:
     start_task = EmptyOperator(task_id="start")
     end_task = EmptyOperator(task_id="end")
 
     with TaskGroup(group_id='pre_loading') as pre_loading:
-        generate_raw_data_task = PythonOperator(
-            task_id='generate_raw_data',
-            python_callable=generate_raw_data,
-            op_args=[True],
+        # The raw data is streamed from memory straight to the bucket,
+        # so no local file is written and no cleanup is needed.
+        generate_raw_data_task = GenerateRawDataToGCSOperator(
+            task_id='generate_raw_data_to_gcs',
+            bucket='ancient-challenge-lavedonio',
+            object_prefix='challenge_data',
+            batch_size=100_000,
+            # Manual runs generate the same data as the scheduled run of their ds
+            time_of_day=DAILY_TIME_OF_DAY,
         )
 
-        for table in RAW_TABLES.values():
-            upload_file_to_bq_task = LocalFilesystemToGCSOperator(
-                task_id=f'upload_file_{table.name}_to_gcs',
-                src=f'raw_{table.name}.csv',
-                dst="".join([
-                    'challenge_data/',
-                    f'raw_{table.name}/',
-                    'ds={{ ds }}/',
-                    'file.csv'
-                ]),
-                bucket='ancient-challenge-lavedonio'
-            )
-            table.pre_loading_upload_gcs_task = upload_file_to_bq_task
-
-            remove_file_task = PythonOperator(
-                task_id=f'remove_file_{table.name}',
-                python_callable=remove_files,
-                op_args=[f'raw_{table.name}.csv']
-            )
-            table.pre_loading_remove_local_task = remove_file_task
-
-            generate_raw_data_task >> upload_file_to_bq_task
-
+    landing_tasks = {}
     with TaskGroup(group_id='level1_landing') as level1_landing:
 
-        for table in RAW_TABLES.values():
-            landing_raw = GCSToBigQueryOperator(
-                task_id=f"landing_raw_{table.name}",
+        for table_name in RAW_TABLES:
+            # Only the files of the current execution date are loaded, overwriting that date's partition,
+            # so that retries and backfills are idempotent and the load cost doesn't grow with history.
+            landing_tasks[f'raw_{table_name}'] = LoadRawTableToBigQueryOperator(
+                task_id=f"landing_raw_{table_name}",
+                raw_table_name=table_name,
                 bucket='ancient-challenge-lavedonio',
-                source_objects=f'challenge_data/raw_{table.name}/*.csv',
+                source_objects=f'challenge_data/raw_{table_name}/ds={{{{ ds }}}}/*.parquet',
                 project_id='stoked-courier-444606-c2',
-                destination_project_dataset_table=f'l1_landing.raw_{table.name}',
-                create_disposition='CREATE_NEVER',
-                write_disposition='WRITE_APPEND',
-                time_partitioning={'field': 'ds', 'type': 'DAY'},
-                autodetect=True,
-                skip_leading_rows=1
-            )
-            table.landing_task = landing_raw
-
-    with TaskGroup(group_id='level2_source') as level2_source:
-        for table in RAW_TABLES.values():
-            dbt_run_source_task = DBTRunOperator(
-                task_id=f"dbt_run_source_{table.name}",
-                model=f"challenge.l2_source.{table.name}",
+                destination_project_dataset_table=f'l1_landing.raw_{table_name}${{{{ ds_nodash }}}}',
+                write_disposition='WRITE_TRUNCATE',
+                # The hour column, used by the micro-batches, is added to the existing tables on the first load
+                schema_update_options=['ALLOW_FIELD_ADDITION'],
             )
-            table.source_task = dbt_run_source_task
-
-    with TaskGroup(group_id='level3_intermediate') as level3_intermediate:
-        dbt_run_intermediate_helper_user_daily_transactions_task = DBTRunOperator(
-            task_id="dbt_run_intermediate_helper_user_daily_transactions",
-            model="challenge.l3_intermediate.helper_user_daily_transactions",
-        )
-
-        dbt_run_intermediate_user_preferences_extra_info_task = DBTRunOperator(
-            task_id="dbt_run_intermediate_user_preferences_extra_info",
-            model="challenge.l3_intermediate.user_preferences_extra_info",
-        )
 
-    with TaskGroup(group_id='level4_final') as level4_final:
-        dbt_run_final_new_users_last_30days_task = DBTRunOperator(
-            task_id="dbt_run_final_new_users_last_30days",
-            model="challenge.level4_final.new_users_last_30days",
-        )
-
-        dbt_run_final_user_activity_summary_task = DBTRunOperator(
-            task_id="dbt_run_final_user_activity_summary",
-            model="challenge.level4_final.user_activity_summary",
-        )
-
-        dbt_run_final_user_daily_transactions_task = DBTRunOperator(
-            task_id="dbt_run_final_user_daily_transactions",
-            model="challenge.level4_final.user_daily_transactions",
-        )
-
-        dbt_run_final_user_latest_preferences_task = DBTRunOperator(
-            task_id="dbt_run_final_user_latest_preferences",
-            model="challenge.level4_final.user_latest_preferences",
-        )
-
-    with TaskGroup(group_id='level5_consumption') as level5_consumption:
-        dbt_run_consumption_report_new_users_last_30days_task = DBTRunOperator(
-            task_id="dbt_run_consumption_report_new_users_last_30days",
-            model="challenge.level5_consumption.report_new_users_last_30days",
-        )
-
-        dbt_run_consumption_report_user_activity_summary_task = DBTRunOperator(
-            task_id="dbt_run_consumption_report_user_activity_summary",
-            model="challenge.level5_consumption.report_user_activity_summary",
-        )
-
-        dbt_run_consumption_report_user_daily_transactions_task = DBTRunOperator(
-            task_id="dbt_run_consumption_report_user_daily_transactions",
-            model="challenge.level5_consumption.report_user_daily_transactions",
-        )
-
-        dbt_run_consumption_report_user_latest_preferences_task = DBTRunOperator(
-            task_id="dbt_run_consumption_report_user_latest_preferences",
-            model="challenge.level5_consumption.report_user_latest_preferences",
+        # Tests of the landed partitions, through the tests of the l1 sources
+        landing_test_task = DBTBatchedTestOperator(task_id='dbt_test_landing', select='l1_landing')
+        list(landing_tasks.values()) >> landing_test_task
+
+    # Levels 2 to 5, with one task group per level and the dependencies following the dbt graph.
+    # The batched tests of each level only check the partitions written by the run, so their cost stays bounded.
+    # When deferrable mode is enabled (see DBT_DEFERRABLE), the models are deferred while the warehouse runs them,
+    # so they don't hold the few worker slots.
+    dbt_tasks = create_dbt_task_groups(DBT_GRAPH, landing_tasks, with_tests=True)
+
+    with TaskGroup(group_id='serving_export') as serving_export:
+        # Snapshots the consumption reports into the local serving cache, for low-latency lookups by user
+        export_reports_task = ExportReportsToServingCacheOperator(
+            task_id='export_reports_to_serving_cache',
+            project_id='stoked-courier-444606-c2',
+            dataset='l5_consumption',
         )
 
     ## Dependencies
-    start_task >> generate_raw_data_task
-
-    pre_loading >> level1_landing
-
-    # Pre Loading to Level 1 to Level 2
-    for table in RAW_TABLES.values():
-        table.create_dependencies()
-
-    # Level 2 to Level 3
-    RAW_TABLES['transactions'].source_task >> dbt_run_intermediate_helper_user_daily_transactions_task
-    RAW_TABLES['user_preferences'].source_task >> dbt_run_intermediate_user_preferences_extra_info_task
-
-    # Levels 2 and 3 to Level 4
-    [
-        RAW_TABLES['transactions'].source_task,
-        RAW_TABLES['users'].source_task
-    ] >> dbt_run_final_new_users_last_30days_task
-    [
-        dbt_run_intermediate_helper_user_daily_transactions_task,
-        dbt_run_intermediate_user_preferences_extra_info_task
-    ] >> dbt_run_final_user_activity_summary_task
-    dbt_run_intermediate_helper_user_daily_transactions_task >> dbt_run_final_user_daily_transactions_task
-    [
-        RAW_TABLES['users'].source_task,
-        dbt_run_intermediate_user_preferences_extra_info_task
-    ] >> dbt_run_final_user_latest_preferences_task
-
-    # Level 4 to Level 5
-    dbt_run_final_new_users_last_30days_task >> dbt_run_consumption_report_new_users_last_30days_task >> end_task
-    dbt_run_final_user_activity_summary_task >> dbt_run_consumption_report_user_activity_summary_task >> end_task
-    dbt_run_final_user_daily_transactions_task >> dbt_run_consumption_report_user_daily_transactions_task >> end_task
-    dbt_run_final_user_latest_preferences_task >> dbt_run_consumption_report_user_latest_preferences_task >> end_task
+    start_task >> pre_loading >> level1_landing
+    [landing_test_task, *get_leaf_tasks(DBT_GRAPH, dbt_tasks)] >> serving_export >> end_task
+
+    # Reports the critical path of the run once every other task is done, even if some of them failed
+    create_critical_path_report_task(dag, end_task)
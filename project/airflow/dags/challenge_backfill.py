@@ -0,0 +1,120 @@
+"""
+# Ancient Gaming Challenge Backfill DAG
+This DAG backfills a range of execution dates of the challenge DAG in a single run.
+
+It's triggered manually with the first and last dates of the range (both included), and goes through the same
+stages as the challenge DAG, but each of them processes the whole range at once:
+
+1. Pre loading: all the days are generated by one task and uploaded in parallel.
+2. Level 1 - landing: the partitions of the range are deleted and the files of all the days are loaded
+by one load job per table.
+3. Levels 2 to 5: each dbt model runs once, processing the partitions of the whole range
+(the ds_start and ds vars are passed to the incremental models).
+
+That way, backfilling N days takes about as long as a single run, instead of N runs of the challenge DAG.
+"""
+
+import datetime
+from pathlib import Path
+
+from airflow import DAG
+from airflow.models.param import Param
+from airflow.operators.empty import EmptyOperator
+from airflow.utils.task_group import TaskGroup
+
+from custom_operators.bigquery import BigQueryQueryOperator, LoadRawTableToBigQueryOperator
+from custom_operators.dbt import DBTBatchedTestOperator
+from custom_operators.dbt_graph import create_dbt_task_groups, get_leaf_tasks, load_dbt_graph
+from custom_operators.gcs import DAILY_TIME_OF_DAY, GenerateRawDataToGCSOperator
+from custom_operators.metrics import create_critical_path_report_task
+
+
+RAW_TABLES = ['users', 'user_preferences', 'transactions']
+
+DBT_GRAPH = load_dbt_graph()
+
+# The dbt models process the partitions of the whole range
+DBT_RANGE_VARS = {'ds_start': '{{ params.start_date }}', 'ds': '{{ params.end_date }}'}
+
+
+with DAG(
+    dag_id=Path(__file__).stem,
+    dag_display_name="Ancient Challenge Backfill",
+    start_date=datetime.datetime(2024, 12, 11),
+    schedule=None,
+    description="This DAG backfills a range of dates of the challenge ELT proccess in a single run",
+    doc_md=__doc__,
+    max_active_runs=1,
+    max_active_tasks=2,
+    params={
+        'start_date': Param(type='string', format='date', description="First date of the range"),
+        'end_date': Param(type='string', format='date', description="Last date of the range (included)"),
+    },
+) as dag:
+    start_task = EmptyOperator(task_id="start")
+    end_task = EmptyOperator(task_id="end")
+
+    with TaskGroup(group_id='pre_loading') as pre_loading:
+        generate_raw_data_task = GenerateRawDataToGCSOperator(
+            task_id='generate_raw_data_to_gcs',
+            bucket='ancient-challenge-lavedonio',
+            object_prefix='challenge_data',
+            batch_size=100_000,
+            start_ds='{{ params.start_date }}',
+            end_ds='{{ params.end_date }}',
+            max_workers=4,
+            # Each day is generated as the scheduled run of the challenge DAG did, not at the trigger time
+            time_of_day=DAILY_TIME_OF_DAY,
+        )
+
+    landing_tasks = {}
+    with TaskGroup(group_id='level1_landing') as level1_landing:
+
+        for table_name in RAW_TABLES:
+            # A load job can't overwrite multiple partitions at once, so the partitions of the range
+            # are deleted first and then appended to, keeping the backfill idempotent.
+            delete_partitions_task = BigQueryQueryOperator(
+                task_id=f"delete_partitions_raw_{table_name}",
+                project_id='stoked-courier-444606-c2',
+                sql=(
+                    f"DELETE FROM l1_landing.raw_{table_name} "
+                    "WHERE ds BETWEEN '{{ params.start_date }}' AND '{{ params.end_date }}'"
+                ),
+            )
+
+            # The objects of every day of the range, as uploaded by the pre loading task, are loaded by a single job
+            landing_tasks[f'raw_{table_name}'] = LoadRawTableToBigQueryOperator(
+                task_id=f"landing_raw_{table_name}",
+                raw_table_name=table_name,
+                bucket='ancient-challenge-lavedonio',
+                source_objects=generate_raw_data_task.output[f'source_objects_{table_name}'],
+                project_id='stoked-courier-444606-c2',
+                destination_project_dataset_table=f'l1_landing.raw_{table_name}',
+                write_disposition='WRITE_APPEND',
+                schema_update_options=['ALLOW_FIELD_ADDITION'],
+            )
+
+            delete_partitions_task >> landing_tasks[f'raw_{table_name}']
+
+        # Tests of the landed partitions, through the tests of the l1 sources
+        landing_test_task = DBTBatchedTestOperator(
+            task_id='dbt_test_landing',
+            select='l1_landing',
+            dbt_vars=DBT_RANGE_VARS,
+        )
+        list(landing_tasks.values()) >> landing_test_task
+
+    # Each model runs once over the whole range
+    dbt_tasks = create_dbt_task_groups(
+        DBT_GRAPH,
+        landing_tasks,
+        with_tests=True,
+        dbt_vars=DBT_RANGE_VARS,
+    )
+
+    ## Dependencies
+    start_task >> pre_loading >> level1_landing
+    [landing_test_task, *get_leaf_tasks(DBT_GRAPH, dbt_tasks)] >> end_task
+
+    # Reports the critical path of the run once every other task is done, even if some of them failed
+    create_critical_path_report_task(dag, end_task)
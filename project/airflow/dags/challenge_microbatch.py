@@ -0,0 +1,127 @@
+"""
+# Ancient Gaming Challenge Micro-batch DAG
+This DAG runs the challenge ELT process in micro-batches: instead of whole days, each run processes a slice
+of the day (one hour by default, see SLICE_HOURS), so the reports are only minutes behind the data.
+
+It goes through the same stages as the challenge DAG, but each of them only handles the slice of the run,
+which starts at its data interval start:
+
+1. Pre loading: the data of the slice is generated and uploaded under the `ds=<ds>/hour=<hour>` prefix.
+2. Level 1 - landing: the rows of the slice are deleted from the day's partition and the slice's files are appended,
+keeping reruns idempotent. The hour column of the landing tables identifies the slice of each row.
+3. Levels 2 to 5: the hour is passed to the dbt models along with the ds, and the incremental models
+only process the rows of the slice, merging them into the existing tables (see the in_current_slice macro).
+4. Serving export: the reports are exported to the serving cache after every slice.
+
+The cost of each run is therefore proportional to the slice, except for the models partitioned by
+transaction date, which still replace the partitions of the transaction dates the slice touched.
+
+This DAG replaces the challenge DAG, so only one of them should be active: both write to the same landing tables.
+"""
+
+import datetime
+from pathlib import Path
+
+from airflow import DAG
+from airflow.operators.empty import EmptyOperator
+from airflow.utils.task_group import TaskGroup
+
+from custom_operators.bigquery import BigQueryQueryOperator, LoadRawTableToBigQueryOperator
+from custom_operators.dbt import DBTBatchedTestOperator
+from custom_operators.dbt_graph import create_dbt_task_groups, get_leaf_tasks, load_dbt_graph
+from custom_operators.gcs import GenerateRawDataToGCSOperator
+from custom_operators.metrics import create_critical_path_report_task
+from custom_operators.serving import ExportReportsToServingCacheOperator
+
+
+RAW_TABLES = ['users', 'user_preferences', 'transactions']
+
+# Length of the slices of the day, in hours. It must divide the day evenly.
+SLICE_HOURS = 1
+
+DBT_GRAPH = load_dbt_graph()
+
+# The dbt models process the slice of the day that starts at the data interval start of the run
+DBT_SLICE_VARS = {'ds': '{{ ds }}', 'hour': '{{ data_interval_start.hour }}'}
+
+
+with DAG(
+    dag_id=Path(__file__).stem,
+    dag_display_name="Ancient Challenge Micro-batch",
+    start_date=datetime.datetime(2024, 12, 11),
+    schedule=f"0 */{SLICE_HOURS} * * *",
+    catchup=False,
+    description="This DAG handles the ELT proccess for the challenge in micro-batches of a slice of the day",
+    doc_md=__doc__,
+    max_active_runs=1,
+    max_active_tasks=2,
+) as dag:
+    start_task = EmptyOperator(task_id="start")
+    end_task = EmptyOperator(task_id="end")
+
+    with TaskGroup(group_id='pre_loading') as pre_loading:
+        generate_raw_data_task = GenerateRawDataToGCSOperator(
+            task_id='generate_raw_data_to_gcs',
+            bucket='ancient-challenge-lavedonio',
+            # Kept apart from the daily files, so they're never loaded by the challenge DAG
+            object_prefix='challenge_data_microbatch',
+            batch_size=100_000,
+            slice_hours=SLICE_HOURS,
+        )
+
+    landing_tasks = {}
+    with TaskGroup(group_id='level1_landing') as level1_landing:
+
+        for table_name in RAW_TABLES:
+            # A load job can only append to or overwrite a whole partition, so the rows of the slice are deleted first.
+            # The hour column is added beforehand, in case the table was only landed by whole days until now.
+            delete_slice_task = BigQueryQueryOperator(
+                task_id=f"delete_slice_raw_{table_name}",
+                project_id='stoked-courier-444606-c2',
+                sql=(
+                    f"ALTER TABLE l1_landing.raw_{table_name} ADD COLUMN IF NOT EXISTS hour INT64; "
+                    f"DELETE FROM l1_landing.raw_{table_name} "
+                    "WHERE ds = '{{ ds }}' AND hour = {{ data_interval_start.hour }}"
+                ),
+            )
+
+            landing_tasks[f'raw_{table_name}'] = LoadRawTableToBigQueryOperator(
+                task_id=f"landing_raw_{table_name}",
+                raw_table_name=table_name,
+                bucket='ancient-challenge-lavedonio',
+                source_objects=generate_raw_data_task.output[f'source_objects_{table_name}'],
+                project_id='stoked-courier-444606-c2',
+                destination_project_dataset_table=f'l1_landing.raw_{table_name}',
+                write_disposition='WRITE_APPEND',
+            )
+
+            delete_slice_task >> landing_tasks[f'raw_{table_name}']
+
+        landing_test_task = DBTBatchedTestOperator(
+            task_id='dbt_test_landing',
+            select='l1_landing',
+            dbt_vars=DBT_SLICE_VARS,
+        )
+        list(landing_tasks.values()) >> landing_test_task
+
+    # Each model merges the rows of the slice, deferring while the warehouse runs it when deferrable mode is enabled
+    dbt_tasks = create_dbt_task_groups(
+        DBT_GRAPH,
+        landing_tasks,
+        with_tests=True,
+        dbt_vars=DBT_SLICE_VARS,
+    )
+
+    with TaskGroup(group_id='serving_export') as serving_export:
+        export_reports_task = ExportReportsToServingCacheOperator(
+            task_id='export_reports_to_serving_cache',
+            project_id='stoked-courier-444606-c2',
+            dataset='l5_consumption',
+        )
+
+    ## Dependencies
+    start_task >> pre_loading >> level1_landing
+    [landing_test_task, *get_leaf_tasks(DBT_GRAPH, dbt_tasks)] >> serving_export >> end_task
+
+    # Reports the critical path of the run once every other task is done, even if some of them failed
+    create_critical_path_report_task(dag, end_task)
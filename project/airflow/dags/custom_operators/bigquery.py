@@ -0,0 +1,106 @@
+"""
+This module contains the BigQuery related custom operators.
+
+They're thin wrappers of the operators of the Google provider, which is only imported when the tasks run,
+along with the Google Cloud client libraries it pulls in. That way, the DAG files that use them
+are parsed by the scheduler without importing any of it (see project/benchmark/dag_parse_benchmark.py).
+"""
+from airflow.models.baseoperator import BaseOperator
+
+
+# BigQuery source format of each file format written by the GenerateRawDataToGCSOperator
+SOURCE_FORMATS = {
+    'parquet': 'PARQUET',
+    'csv': 'CSV',
+}
+
+
+class LoadRawTableToBigQueryOperator(BaseOperator):
+    """
+    This operator loads the files of a raw table from Google Cloud Storage into its landing table,
+    partitioned by ds, through the GCSToBigQueryOperator. The files are loaded with the explicit schema
+    of the raw table (see get_bigquery_schema_fields), so the types are never inferred.
+
+    The file format must be the one the files were written with by the GenerateRawDataToGCSOperator:
+    Parquet (the default) or gzip-compressed CSV, whose header row is skipped.
+    """
+
+    template_fields = ('source_objects', 'destination_project_dataset_table')
+
+    def __init__(
+        self,
+        raw_table_name: str,
+        bucket: str,
+        source_objects: str | list[str],
+        destination_project_dataset_table: str,
+        project_id: str,
+        write_disposition: str = 'WRITE_APPEND',
+        schema_update_options: list[str] | None = None,
+        file_format: str = 'parquet',
+        gcp_conn_id: str = 'google_cloud_default',
+        **kwargs
+    ) -> None:
+        if file_format not in SOURCE_FORMATS:
+            raise ValueError(f"Unknown file format {file_format}, it must be one of {', '.join(SOURCE_FORMATS)}")
+
+        super().__init__(**kwargs)
+        self.raw_table_name = raw_table_name
+        self.bucket = bucket
+        self.source_objects = source_objects
+        self.destination_project_dataset_table = destination_project_dataset_table
+        self.project_id = project_id
+        self.write_disposition = write_disposition
+        self.schema_update_options = schema_update_options
+        self.file_format = file_format
+        self.gcp_conn_id = gcp_conn_id
+
+    def execute(self, context):
+        from airflow.providers.google.cloud.transfers.gcs_to_bigquery import GCSToBigQueryOperator
+        from scripts.generate_raw_data import get_bigquery_schema_fields
+
+        load_operator = GCSToBigQueryOperator(
+            task_id=self.task_id,
+            bucket=self.bucket,
+            source_objects=self.source_objects,
+            project_id=self.project_id,
+            destination_project_dataset_table=self.destination_project_dataset_table,
+            create_disposition='CREATE_NEVER',
+            write_disposition=self.write_disposition,
+            time_partitioning={'field': 'ds', 'type': 'DAY'},
+            source_format=SOURCE_FORMATS[self.file_format],
+            skip_leading_rows=1 if self.file_format == 'csv' else None,
+            schema_fields=get_bigquery_schema_fields(self.raw_table_name),
+            autodetect=False,
+            schema_update_options=self.schema_update_options or (),
+            gcp_conn_id=self.gcp_conn_id,
+        )
+        return load_operator.execute(context)
+
+
+class BigQueryQueryOperator(BaseOperator):
+    """This operator runs a (standard SQL) query or script as a BigQuery job, through the BigQueryInsertJobOperator."""
+
+    template_fields = ('sql',)
+
+    def __init__(
+        self,
+        sql: str,
+        project_id: str,
+        gcp_conn_id: str = 'google_cloud_default',
+        **kwargs
+    ) -> None:
+        super().__init__(**kwargs)
+        self.sql = sql
+        self.project_id = project_id
+        self.gcp_conn_id = gcp_conn_id
+
+    def execute(self, context):
+        from airflow.providers.google.cloud.operators.bigquery import BigQueryInsertJobOperator
+
+        job_operator = BigQueryInsertJobOperator(
+            task_id=self.task_id,
+            project_id=self.project_id,
+            configuration={'query': {'query': self.sql, 'useLegacySql': False}},
+            gcp_conn_id=self.gcp_conn_id,
+        )
+        return job_operator.execute(context)
@@ -1,12 +1,48 @@
 """
 This module contains all the DBT related custom operators and auxiliary functions.
 """
+import datetime
+import functools
+import json
+import os
+import re
+import tempfile
+import time
 from pathlib import Path
 
+from airflow.exceptions import AirflowException
+from airflow.models.baseoperator import BaseOperator
 from airflow.operators.bash import BashOperator
 
+from custom_operators.dbt_jobs import DBT_JOBS_PATH, DBTJobBackend, DBTJobTrigger, SubprocessDBTJobBackend
+from custom_operators.dbt_jobs import get_node_errors, get_node_results, isolated_target_path, set_target_path
+from custom_operators.metrics import emit_dbt_metrics, emit_metrics, get_queued_seconds
+
 
 DBT_PATH = Path(__file__).resolve().parents[1] / 'dbt'
+DBT_PROJECT_PATH = DBT_PATH / 'ancient'
+
+# The target path is kept in the worker's local disk, so that the partial parsing state written by one task
+# is reused by the following ones, instead of being written to the (slow) DAGs bucket mount.
+# Each invocation runs in its own copy of it (see isolated_target_path), since dbt doesn't support concurrent
+# invocations on the same target path.
+DBT_TARGET_PATH = Path(tempfile.gettempdir()) / 'dbt' / 'ancient' / 'target'
+
+# The execution date is passed to the incremental models, which only process that date's partition.
+DBT_VARS = """--vars '{"ds": "{{ ds }}"}'"""
+
+# The model tasks are only deferrable when enabled with ANCIENT_DBT_DEFERRABLE=true, since that requires the triggerer,
+# a jobs path shared with it (ANCIENT_DBT_JOBS_PATH) and the dbt_jobs pool to be set up. Otherwise, they run in-process.
+DBT_DEFERRABLE = os.environ.get('ANCIENT_DBT_DEFERRABLE', 'false').lower() == 'true'
+
+# Pool of the deferrable dbt tasks, which caps the number of dbt jobs in flight. It must be created with
+# include_deferred, so the deferred tasks keep holding their pool slot while their job runs:
+#   airflow pools set dbt_jobs 8 "dbt jobs in flight" --include-deferred
+DBT_JOBS_POOL = 'dbt_jobs'
+
+# Incremental models are fully rebuilt when the operator is created with full_refresh=True
+# or when the DAG run is triggered with the full_refresh param (e.g. for backfills).
+DBT_FULL_REFRESH = "{{ '--full-refresh' if params.get('full_refresh') else '' }}"
 
 
 class DBTRunOperator(BashOperator):
@@ -15,14 +51,17 @@ class DBTRunOperator(BashOperator):
     easy to create and standardized.
     """
 
-    def __init__(self, model: str, **kwargs) -> None:
+    def __init__(self, model: str, full_refresh: bool = False, **kwargs) -> None:
         self.model = model
+        self.full_refresh = full_refresh
         dbt_project_path = DBT_PATH / 'ancient'
-        kwargs['bash_command'] = f"dbt run --project-dir {dbt_project_path} --profiles-dir {dbt_project_path} --select {self.model}"
+        full_refresh_flag = '--full-refresh' if full_refresh else DBT_FULL_REFRESH
+        kwargs['bash_command'] = f"dbt run --project-dir {dbt_project_path} --profiles-dir {dbt_project_path} --select {self.model} {DBT_VARS} {full_refresh_flag}"
         super().__init__(**kwargs)
 
     def execute(self, context):
         super().execute(context)
+        return emit_dbt_metrics(read_run_results(DBT_PROJECT_PATH / 'target'), context)
 
 
 class DBTTestOperator(BashOperator):
@@ -34,11 +73,253 @@ class DBTTestOperator(BashOperator):
     def __init__(self, model: str, **kwargs) -> None:
         self.model = model
         dbt_project_path = DBT_PATH / 'ancient'
-        kwargs['bash_command'] = f"dbt test --project-dir {dbt_project_path} --profiles-dir {dbt_project_path} --select {self.model}"
+        kwargs['bash_command'] = f"dbt test --project-dir {dbt_project_path} --profiles-dir {dbt_project_path} --select {self.model} {DBT_VARS}"
         super().__init__(**kwargs)
 
     def execute(self, context):
         super().execute(context)
+        return emit_dbt_metrics(read_run_results(DBT_PROJECT_PATH / 'target'), context)
+
+
+def read_run_results(target_path: Path) -> list[dict]:
+    """Reads the results of the last dbt invocation from the run_results.json artifact."""
+    with open(target_path / 'run_results.json') as run_results_file:
+        return json.load(run_results_file)['results']
+
+
+def get_dbt_base_args() -> list[str]:
+    """Returns the arguments shared by all the in-process dbt invocations."""
+    return [
+        '--project-dir', str(DBT_PROJECT_PATH),
+        '--profiles-dir', str(DBT_PROJECT_PATH),
+        '--target-path', str(DBT_TARGET_PATH),
+    ]
+
+
+@functools.cache
+def get_dbt_runner(dbt_vars: str):
+    """
+    Returns a dbtRunner with the parsed project manifest, parsing it only once per process and vars.
+
+    Each Airflow task runs in its own process, so the manifest in memory is only reused by the invocations
+    of the same task. Across tasks, the parsing is made incremental by the partial parsing state shared through
+    DBT_TARGET_PATH: since the vars are the same for the whole DAG run, only the first task of the run
+    parses the whole project. The adapter connections aren't pooled across tasks, since they don't outlive the task.
+    """
+    # dbt is only imported when it's actually needed, since it's a heavy import
+    from dbt.cli.main import dbtRunner
+
+    with isolated_target_path(DBT_TARGET_PATH) as target_path:
+        parse_result = dbtRunner().invoke(
+            set_target_path(['parse', *get_dbt_base_args(), '--vars', dbt_vars], target_path)
+        )
+    if not parse_result.success:
+        raise AirflowException(f"dbt parse failed: {parse_result.exception or get_node_errors(parse_result)}")
+
+    return dbtRunner(manifest=parse_result.result)
+
+
+def invoke_dbt(dbt_vars: str, args: list[str], callbacks: list | None = None):
+    """
+    Runs the dbt invocation in the worker process, with the parsed manifest and in its own target path,
+    which doesn't need the partial parsing state since the project is already parsed.
+    The callbacks, if given, are called with each event of the invocation.
+    """
+    runner = get_dbt_runner(dbt_vars)
+    if callbacks:
+        from dbt.cli.main import dbtRunner
+
+        runner = dbtRunner(manifest=runner.manifest, callbacks=callbacks)
+    with isolated_target_path(None) as target_path:
+        return runner.invoke(set_target_path(args, target_path))
+
+
+class DBTInProcessOperator(BaseOperator):
+    """
+    This operator runs dbt programmatically inside the worker process, instead of in a new dbt process.
+
+    The project is parsed incrementally from the state left by the previous tasks (see get_dbt_runner),
+    so each invocation mostly pays for the SQL itself. The selection can be a single model or multiple selectors
+    (e.g. a whole level), which are then run as one invocation with the given number of threads.
+
+    The ds of the run is passed to the models as a var. Other vars (e.g. ds_start for range backfills)
+    can be given through dbt_vars, which can also override the ds.
+    """
+
+    template_fields = ('select', 'dbt_vars')
+
+    def __init__(
+        self,
+        select: str | list[str],
+        command: str = 'run',
+        threads: int | None = None,
+        full_refresh: bool = False,
+        dbt_vars: dict | None = None,
+        **kwargs
+    ) -> None:
+        super().__init__(**kwargs)
+        self.select = select
+        self.command = command
+        self.threads = threads
+        self.full_refresh = full_refresh
+        self.dbt_vars = dbt_vars
+
+    def get_dbt_args(self, context, dbt_vars: str) -> list[str]:
+        """Builds the dbt command line arguments of this task."""
+        select = [self.select] if isinstance(self.select, str) else list(self.select)
+        args = [self.command, *get_dbt_base_args(), '--vars', dbt_vars, '--select', *select]
+
+        if self.threads:
+            args.extend(['--threads', str(self.threads)])
+
+        if self.command in ('run', 'build') and (self.full_refresh or context['params'].get('full_refresh')):
+            args.append('--full-refresh')
+
+        return args
+
+    def get_dbt_vars(self, context) -> str:
+        """
+        The execution date is passed to the incremental models, which only process that date's partition
+        (or the partitions from ds_start to ds, when given).
+        """
+        return json.dumps({'ds': context['ds'], **(self.dbt_vars or {})}, sort_keys=True)
+
+    def execute(self, context):
+        dbt_vars = self.get_dbt_vars(context)
+        result = invoke_dbt(dbt_vars, self.get_dbt_args(context, dbt_vars))
+
+        # The results are read from memory instead of the run_results.json artifact of the temporary target path
+        model_metrics = emit_dbt_metrics(get_node_results(result), context)
+
+        if not result.success:
+            raise AirflowException(
+                f"dbt {self.command} failed for {self.select}: {result.exception or get_node_errors(result)}"
+            )
+
+        return model_metrics
+
+
+class DBTDeferrableOperator(DBTInProcessOperator):
+    """
+    Deferrable variant of the DBTInProcessOperator: the dbt invocation is submitted to a job backend
+    (see custom_operators/dbt_jobs.py) and the task is deferred until it's done, with the polling
+    done by a trigger on the triggerer. That way, the worker slot isn't held while the warehouse runs the models,
+    and deferred tasks don't count towards the max_active_tasks of the DAG, so far more models can be in flight.
+
+    Each try submits its own job, and the metrics of the models are emitted when the task resumes.
+    The job fails if it's still running after the execution_timeout of the task, or the job_timeout when not given.
+
+    Since deferred tasks don't count towards max_active_tasks, the tasks run in the dbt_jobs pool (see DBT_JOBS_POOL),
+    which caps the number of dbt jobs in flight, deferred or not.
+
+    Without a backend, the jobs run on the SubprocessDBTJobBackend, so the DAG fails to import
+    while ANCIENT_DBT_JOBS_PATH isn't set, instead of its tasks failing when they run.
+    """
+
+    def __init__(
+        self,
+        backend: DBTJobBackend | None = None,
+        poll_interval: float = 10.0,
+        job_timeout: datetime.timedelta = datetime.timedelta(hours=1),
+        **kwargs
+    ) -> None:
+        if backend is None and DBT_JOBS_PATH is None:
+            raise AirflowException(
+                "The deferrable dbt tasks need ANCIENT_DBT_JOBS_PATH to point to a directory shared by the workers "
+                "and the triggerer. Set it, or unset ANCIENT_DBT_DEFERRABLE to run the models in-process"
+            )
+
+        kwargs.setdefault('pool', DBT_JOBS_POOL)
+        super().__init__(**kwargs)
+        self.backend = backend or SubprocessDBTJobBackend()
+        self.poll_interval = poll_interval
+        self.job_timeout = job_timeout
+
+    def get_job_id(self, context) -> str:
+        """A job id that's unique per task try and safe to use as a file name."""
+        ti = context['ti']
+        return re.sub(r'[^\w.-]', '_', f"{ti.dag_id}__{ti.run_id}__{ti.task_id}__{ti.map_index}__{ti.try_number}")
+
+    def execute(self, context):
+        dbt_vars = self.get_dbt_vars(context)
+        job_id = self.get_job_id(context)
+        deadline = time.time() + (self.execution_timeout or self.job_timeout).total_seconds()
+
+        self.backend.submit(job_id, self.get_dbt_args(context, dbt_vars), deadline)
+        self.log.info("Submitted the dbt job %s, deferring until it's done", job_id)
+
+        backend_classpath, backend_kwargs = self.backend.serialize()
+        self.defer(
+            trigger=DBTJobTrigger(job_id, backend_classpath, backend_kwargs, deadline, self.poll_interval),
+            method_name='execute_complete',
+            timeout=self.execution_timeout,
+        )
+
+    def execute_complete(self, context, event: dict):
+        model_metrics = emit_dbt_metrics(event['results'], context)
+
+        if not event['success']:
+            raise AirflowException(f"dbt {self.command} failed for {self.select} (job {event['job_id']}): {event['error']}")
+
+        return model_metrics
+
+
+class DBTBatchedTestOperator(DBTInProcessOperator):
+    """
+    This operator runs the data tests of a whole level (e.g. l2_source) as one in-process invocation,
+    through the run_batched_tests macro of the dbt project: the tests are restricted to the partitions
+    written by the current run and the tests of each model are combined into a single query,
+    so their cost doesn't grow with the history. In micro-batch mode (when the hour var is given through dbt_vars),
+    they're further restricted to the rows written by the slice.
+
+    On full refreshes, every partition is tested instead.
+    """
+
+    def get_dbt_vars(self, context) -> str:
+        dbt_vars = json.loads(super().get_dbt_vars(context))
+        if self.full_refresh or context['params'].get('full_refresh'):
+            dbt_vars['test_all_partitions'] = True
+        return json.dumps(dbt_vars, sort_keys=True)
+
+    def get_dbt_args(self, context, dbt_vars: str) -> list[str]:
+        return [
+            'run-operation', 'run_batched_tests',
+            *get_dbt_base_args(),
+            '--vars', dbt_vars,
+            '--args', json.dumps({'select': self.select}),
+        ]
+
+    def execute(self, context):
+        start_time = time.perf_counter()
+        dbt_vars = self.get_dbt_vars(context)
+
+        # The failed tests are only reported by the error event of the macro, since the result of a run-operation
+        # has neither an exception nor a message when the macro raises
+        error_messages = []
+
+        def collect_errors(event):
+            if event.info.level == 'error':
+                error_messages.append(event.info.msg)
+
+        result = invoke_dbt(dbt_vars, self.get_dbt_args(context, dbt_vars), callbacks=[collect_errors])
+        metrics = emit_metrics(
+            'dbt_test',
+            self.select,
+            {
+                'success': result.success,
+                'elapsed_seconds': time.perf_counter() - start_time,
+                'queued_seconds': get_queued_seconds(context),
+            },
+            context,
+        )
+
+        if not result.success:
+            raise AirflowException(
+                f"dbt tests failed for {self.select}: "
+                f"{result.exception or get_node_errors(result) or '; '.join(error_messages)}"
+            )
+
+        return metrics
 
 
 def dbt_run_and_test_operators(base_task_id: str, model: str) -> tuple[DBTRunOperator, DBTTestOperator]:
@@ -50,7 +331,7 @@ def dbt_run_and_test_operators(base_task_id: str, model: str) -> tuple[DBTRunOpe
         model=model,
     )
 
-    dbt_test_task = DBTRunOperator(
+    dbt_test_task = DBTTestOperator(
         task_id=f"dbt_test_{base_task_id}",
         model=model,
     )
@@ -0,0 +1,154 @@
+"""
+This module builds the DBT tasks of a DAG from the dependency graph of the compiled dbt manifest.
+
+The manifest is created by running `dbt parse` on the project before deploying it (the dbt tasks write their
+artifacts to their own target paths, so they never create it). Since the manifest can be quite large,
+only the model graph is extracted from it and cached on disk, keyed by the manifest's modification time and size,
+so that parsing the DAG file doesn't even read the manifest.
+"""
+import hashlib
+import json
+import tempfile
+from dataclasses import dataclass, asdict
+from pathlib import Path
+
+from airflow.models.baseoperator import BaseOperator
+from airflow.utils.task_group import TaskGroup
+
+from custom_operators.dbt import DBT_DEFERRABLE, DBT_PROJECT_PATH, DBTBatchedTestOperator, DBTDeferrableOperator, DBTInProcessOperator
+
+
+DBT_MANIFEST_PATH = DBT_PROJECT_PATH / 'target' / 'manifest.json'
+DBT_GRAPH_CACHE_PATH = Path(tempfile.gettempdir()) / 'dbt' / 'ancient' / 'graph_cache'
+
+
+@dataclass
+class DBTModelNode:
+    unique_id: str
+    name: str
+    level: str
+    select: str
+    depends_on: list[str]
+    sources: list[str]
+
+    @property
+    def group_id(self) -> str:
+        """Task group of the model level, e.g. l2_source -> level2_source."""
+        level_number, level_name = self.level.split('_', 1)
+        return f"level{level_number.removeprefix('l')}_{level_name}"
+
+    @property
+    def task_id(self) -> str:
+        """Task id of the model, e.g. dbt_run_source_users."""
+        return f"dbt_run_{self.level.split('_', 1)[1]}_{self.name}"
+
+
+def parse_dbt_manifest(manifest: dict) -> dict[str, DBTModelNode]:
+    """Extracts the models of the project and their dependencies on other models and sources."""
+    project_name = manifest['metadata'].get('project_name')
+    graph = {}
+
+    for unique_id, node in manifest['nodes'].items():
+        if node['resource_type'] != 'model' or (project_name and node['package_name'] != project_name):
+            continue
+
+        dependencies = node['depends_on']['nodes']
+        graph[unique_id] = DBTModelNode(
+            unique_id=unique_id,
+            name=node['name'],
+            level=node['fqn'][-2],
+            select='.'.join(node['fqn'][1:]),
+            depends_on=sorted(x for x in dependencies if x.startswith('model.')),
+            sources=sorted(manifest['sources'][x]['name'] for x in dependencies if x.startswith('source.')),
+        )
+
+    return graph
+
+
+def load_dbt_graph(
+    manifest_path: Path = DBT_MANIFEST_PATH,
+    cache_path: Path = DBT_GRAPH_CACHE_PATH,
+) -> dict[str, DBTModelNode]:
+    """
+    Loads the model graph of the dbt manifest.
+    The graph is cached on disk by the manifest's path, modification time and size,
+    so the (large) manifest is only read and parsed once per version.
+    """
+    try:
+        manifest_stat = manifest_path.stat()
+    except FileNotFoundError:
+        raise FileNotFoundError(
+            f"The dbt manifest {manifest_path} doesn't exist. The DAGs are built from it, so it must be created "
+            f"with `dbt parse --project-dir {DBT_PROJECT_PATH} --profiles-dir {DBT_PROJECT_PATH}` before deploying"
+        ) from None
+
+    manifest_version = f'{manifest_path.resolve()}:{manifest_stat.st_mtime_ns}:{manifest_stat.st_size}'
+    graph_cache_file = cache_path / f'{hashlib.sha256(manifest_version.encode()).hexdigest()}.json'
+
+    try:
+        cached_graph = json.loads(graph_cache_file.read_text())
+    except (OSError, ValueError):
+        graph = parse_dbt_manifest(json.loads(manifest_path.read_bytes()))
+
+        cache_path.mkdir(parents=True, exist_ok=True)
+        # Written to a temporary file first, so concurrent DAG parses never read a partial cache file
+        with tempfile.NamedTemporaryFile('w', dir=cache_path, suffix='.tmp', delete=False) as temporary_cache_file:
+            json.dump([asdict(node) for node in graph.values()], temporary_cache_file)
+        Path(temporary_cache_file.name).replace(graph_cache_file)
+        return graph
+
+    return {node['unique_id']: DBTModelNode(**node) for node in cached_graph}
+
+
+def create_dbt_task_groups(
+    graph: dict[str, DBTModelNode],
+    source_tasks: dict[str, BaseOperator],
+    with_tests: bool = False,
+    deferrable: bool = DBT_DEFERRABLE,
+    **operator_kwargs
+) -> dict[str, BaseOperator]:
+    """
+    Creates one task per model, inside the task group of its level, and sets the dependencies between them
+    following the dbt graph. Models that read from sources are set downstream of the given source tasks,
+    keyed by the source table name. Returns the created tasks, keyed by the model unique id.
+
+    With tests, each level also gets a task that runs the batched tests of its models once all of them ran,
+    keyed by test.<level>. No other task depends on them, so the tests don't delay the following levels.
+
+    When deferrable (by default, when enabled by ANCIENT_DBT_DEFERRABLE), the models run as DBTDeferrableOperator tasks,
+    which release their worker slots while the warehouse runs them. Otherwise, they run as DBTInProcessOperator tasks.
+    """
+    model_operator_class = DBTDeferrableOperator if deferrable else DBTInProcessOperator
+    tasks = {}
+    for level in sorted({node.level for node in graph.values()}):
+        level_nodes = sorted((node for node in graph.values() if node.level == level), key=lambda x: x.name)
+
+        with TaskGroup(group_id=level_nodes[0].group_id):
+            for node in level_nodes:
+                tasks[node.unique_id] = model_operator_class(
+                    task_id=node.task_id,
+                    select=node.select,
+                    **operator_kwargs,
+                )
+
+            if with_tests:
+                tasks[f'test.{level}'] = DBTBatchedTestOperator(
+                    task_id=f"dbt_test_{level.split('_', 1)[1]}",
+                    select=level,
+                    **operator_kwargs,
+                )
+                [tasks[node.unique_id] for node in level_nodes] >> tasks[f'test.{level}']
+
+    for node in graph.values():
+        for upstream_id in node.depends_on:
+            tasks[upstream_id] >> tasks[node.unique_id]
+        for source_name in node.sources:
+            source_tasks[source_name] >> tasks[node.unique_id]
+
+    return tasks
+
+
+def get_leaf_tasks(graph: dict[str, DBTModelNode], tasks: dict[str, BaseOperator]) -> list[BaseOperator]:
+    """Returns the tasks of the models that no other model depends on, along with the test tasks."""
+    upstream_ids = {upstream_id for node in graph.values() for upstream_id in node.depends_on}
+    return [task for unique_id, task in tasks.items() if unique_id not in upstream_ids]
@@ -0,0 +1,372 @@
+"""
+This module contains the job backends and the trigger of the deferrable dbt operator (see DBTDeferrableOperator).
+
+A job backend runs a dbt invocation outside of the task that submitted it, and reports its status
+(None while it's running, or its result once it's done). The trigger polls the backend on the triggerer,
+so the worker slot of the task is released while the warehouse runs the models.
+
+Triggers are serialized to the metadata database and rebuilt by the triggerer, so the backends are too:
+each one is rebuilt from its class path and the kwargs returned by its serialize method.
+
+Each job has a deadline: a job that's still running by then fails, and so does a job whose process
+stopped sending heartbeats (e.g. because its worker was recycled), so a deferred task never waits forever.
+
+Running this module runs the dbt invocation of a job submitted by the SubprocessDBTJobBackend:
+    python -m custom_operators.dbt_jobs <job_path>
+"""
+import asyncio
+import contextlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, AsyncIterator, Iterator
+
+from airflow.exceptions import AirflowException
+from airflow.triggers.base import BaseTrigger, TriggerEvent
+from airflow.utils.module_loading import import_string
+
+
+DAGS_PATH = Path(__file__).resolve().parents[1]
+
+# Where the jobs keep their arguments, logs, heartbeats and status. The triggerer runs apart from the workers
+# (in Composer, in its own pod), so it must be a directory shared by all of them, e.g. under the mounted bucket:
+# /home/airflow/gcs/data/dbt_jobs. There's no default, since the triggerer would never see a worker-local directory.
+DBT_JOBS_PATH = os.environ.get('ANCIENT_DBT_JOBS_PATH')
+
+# The job processes write a heartbeat every HEARTBEAT_INTERVAL seconds, and a job without a heartbeat
+# for more than HEARTBEAT_TIMEOUT seconds is considered dead.
+HEARTBEAT_INTERVAL = 30
+HEARTBEAT_TIMEOUT = 300
+
+# The partial parsing state of dbt, which makes the parsing incremental when the project didn't change
+PARTIAL_PARSE_FILE = 'partial_parse.msgpack'
+
+
+def get_node_results(result) -> list[dict]:
+    """Converts the node results of a dbtRunner invocation to the format of the run_results.json artifact."""
+    if result.result is None or not hasattr(result.result, 'results'):
+        return []
+
+    return [
+        {
+            'unique_id': node_result.node.unique_id,
+            'status': node_result.status,
+            'execution_time': node_result.execution_time,
+            'timing': [
+                {'name': x.name, 'started_at': x.started_at, 'completed_at': x.completed_at}
+                for x in node_result.timing
+            ],
+            'adapter_response': node_result.adapter_response,
+        }
+        for node_result in result.result.results
+    ]
+
+
+def get_node_errors(result) -> str | None:
+    """
+    Returns the messages of the failed nodes of a dbtRunner invocation, if any. The exception of the invocation
+    is only set when dbt itself failed, so it's None when the models failed (e.g. on compilation errors).
+    The results of run-operation invocations have no node, only its unique id.
+    """
+    node_errors = [
+        f"{node_result.node.unique_id if hasattr(node_result, 'node') else node_result.unique_id}: {node_result.message}"
+        for node_result in getattr(result.result, 'results', None) or []
+        if node_result.status in ('error', 'fail') and node_result.message
+    ]
+    return '; '.join(node_errors) or None
+
+
+def write_json_atomically(path: Path, content: Any) -> None:
+    """Writes to a temporary file first, so readers in other processes never read a partial file."""
+    with tempfile.NamedTemporaryFile('w', dir=path.parent, suffix='.tmp', delete=False) as temporary_file:
+        json.dump(content, temporary_file, default=str)
+    Path(temporary_file.name).replace(path)
+
+
+def read_json(path: Path) -> Any:
+    """Returns the content of the JSON file, or None if it doesn't exist (yet)."""
+    try:
+        return json.loads(path.read_text())
+    except FileNotFoundError:
+        return None
+
+
+def get_target_path(args: list[str]) -> Path | None:
+    """Returns the target path of the dbt arguments, if any."""
+    return Path(args[args.index('--target-path') + 1]) if '--target-path' in args else None
+
+
+def set_target_path(args: list[str], target_path: Path) -> list[str]:
+    """Returns the dbt arguments with the given target path, replacing the one they had, if any."""
+    if '--target-path' not in args:
+        return [*args, '--target-path', str(target_path)]
+
+    target_path_index = args.index('--target-path') + 1
+    return [*args[:target_path_index], str(target_path), *args[target_path_index + 1:]]
+
+
+@contextlib.contextmanager
+def isolated_target_path(shared_target_path: Path | None) -> Iterator[Path]:
+    """
+    Yields a temporary target path for a dbt invocation, since dbt doesn't support concurrent invocations
+    on the same target path. It's seeded with the partial parsing state of the shared target path, if any,
+    which is then replaced (atomically) by the updated state, so the parsing stays incremental across invocations.
+    """
+    with tempfile.TemporaryDirectory(prefix='dbt_target_') as target_path:
+        target_path = Path(target_path)
+        if shared_target_path is None:
+            yield target_path
+            return
+
+        with contextlib.suppress(FileNotFoundError):
+            shutil.copyfile(shared_target_path / PARTIAL_PARSE_FILE, target_path / PARTIAL_PARSE_FILE)
+
+        yield target_path
+
+        if (target_path / PARTIAL_PARSE_FILE).exists():
+            shared_target_path.mkdir(parents=True, exist_ok=True)
+            with tempfile.NamedTemporaryFile(dir=shared_target_path, suffix='.tmp', delete=False) as temporary_file:
+                pass
+            shutil.copyfile(target_path / PARTIAL_PARSE_FILE, temporary_file.name)
+            Path(temporary_file.name).replace(shared_target_path / PARTIAL_PARSE_FILE)
+
+
+class DBTJobBackend:
+    """Base class of the job backends, which submit the dbt invocations and report their status."""
+
+    def submit(self, job_id: str, args: list[str], deadline: float) -> None:
+        """
+        Starts the dbt invocation with the given arguments, without waiting for it.
+        The job must fail if it's still running by the deadline (a Unix timestamp).
+        """
+        raise NotImplementedError
+
+    async def get_status(self, job_id: str) -> dict | None:
+        """
+        Returns None while the job is running, and then its status: success, error
+        and the node results, in the format of the run_results.json artifact.
+        """
+        raise NotImplementedError
+
+    def serialize(self) -> tuple[str, dict[str, Any]]:
+        """Returns the class path and the kwargs the backend is rebuilt from on the triggerer."""
+        raise NotImplementedError
+
+
+class SubprocessDBTJobBackend(DBTJobBackend):
+    """
+    Runs each job in a detached dbt process on the worker, which outlives the task once it's deferred.
+    The process writes its heartbeat to the job directory while it runs, and the status of the job when it finishes.
+
+    The worker slot is released, but the dbt processes still run on the worker machine, which is fine
+    since they spend almost all of their time waiting on the warehouse. Their number is capped by the pool
+    of the deferrable tasks (see DBTDeferrableOperator).
+
+    dbt doesn't support concurrent invocations on the same target path, so each job runs with its own
+    temporary target path on the worker's local disk, seeded with the partial parsing state of the target path
+    of its arguments (see isolated_target_path).
+    """
+
+    def __init__(self, jobs_path: str | None = DBT_JOBS_PATH, heartbeat_timeout: float = HEARTBEAT_TIMEOUT) -> None:
+        self.jobs_path = Path(jobs_path) if jobs_path else None
+        self.heartbeat_timeout = heartbeat_timeout
+
+    def get_job_path(self, job_id: str) -> Path:
+        if self.jobs_path is None:
+            raise AirflowException(
+                "The dbt jobs path isn't set: ANCIENT_DBT_JOBS_PATH must point to a directory shared by the workers "
+                "and the triggerer (e.g. /home/airflow/gcs/data/dbt_jobs), otherwise the jobs are never seen as done"
+            )
+        return self.jobs_path / job_id
+
+    def submit(self, job_id: str, args: list[str], deadline: float) -> None:
+        job_path = self.get_job_path(job_id)
+        job_path.mkdir(parents=True, exist_ok=True)
+        (job_path / 'status.json').unlink(missing_ok=True)
+        write_json_atomically(job_path / 'job.json', {'args': args, 'deadline': deadline})
+        # The first heartbeat is written here, so the job isn't considered dead while its process starts
+        write_json_atomically(job_path / 'heartbeat.json', time.time())
+
+        with open(job_path / 'dbt.log', 'ab') as log_file:
+            # Run from the DAGs folder, so the module is importable by the new process
+            subprocess.Popen(
+                [sys.executable, '-m', 'custom_operators.dbt_jobs', str(job_path)],
+                cwd=DAGS_PATH,
+                stdin=subprocess.DEVNULL,
+                stdout=log_file,
+                stderr=subprocess.STDOUT,
+                start_new_session=True,
+            )
+
+    async def get_status(self, job_id: str) -> dict | None:
+        job_path = self.get_job_path(job_id)
+        status = await asyncio.to_thread(read_json, job_path / 'status.json')
+        if status is not None:
+            return status
+
+        last_heartbeat = await asyncio.to_thread(read_json, job_path / 'heartbeat.json')
+        if last_heartbeat is None or time.time() - last_heartbeat > self.heartbeat_timeout:
+            return {
+                'success': False,
+                'error': (
+                    f"The dbt job {job_id} stopped sending heartbeats, so its process is gone "
+                    f"(e.g. its worker was recycled). See {job_path / 'dbt.log'}"
+                ),
+                'results': [],
+            }
+
+        return None
+
+    def serialize(self) -> tuple[str, dict[str, Any]]:
+        return (
+            'custom_operators.dbt_jobs.SubprocessDBTJobBackend',
+            {'jobs_path': str(self.jobs_path) if self.jobs_path else None, 'heartbeat_timeout': self.heartbeat_timeout},
+        )
+
+
+class LocalFakeDBTJobBackend(DBTJobBackend):
+    """
+    Fake backend to test the deferrable operator and the trigger without dbt or a warehouse:
+    nothing is run, and each job just finishes with the given outcome after the given duration.
+    The jobs are kept in local files, so the trigger sees the jobs submitted by the operator from another process.
+    """
+
+    def __init__(self, jobs_path: str, duration_seconds: float = 1.0, success: bool = True) -> None:
+        self.jobs_path = Path(jobs_path)
+        self.duration_seconds = duration_seconds
+        self.success = success
+
+    def submit(self, job_id: str, args: list[str], deadline: float) -> None:
+        self.jobs_path.mkdir(parents=True, exist_ok=True)
+        write_json_atomically(
+            self.jobs_path / f'{job_id}.json',
+            {'args': args, 'completes_at': time.time() + self.duration_seconds},
+        )
+
+    async def get_status(self, job_id: str) -> dict | None:
+        job = json.loads(await asyncio.to_thread((self.jobs_path / f'{job_id}.json').read_text))
+        if time.time() < job['completes_at']:
+            return None
+
+        return {
+            'success': self.success,
+            'error': None if self.success else f"Fake failure of the job {job_id}",
+            'results': [],
+        }
+
+    def serialize(self) -> tuple[str, dict[str, Any]]:
+        return (
+            'custom_operators.dbt_jobs.LocalFakeDBTJobBackend',
+            {'jobs_path': str(self.jobs_path), 'duration_seconds': self.duration_seconds, 'success': self.success},
+        )
+
+
+class DBTJobTrigger(BaseTrigger):
+    """
+    Polls the status of a dbt job on the triggerer, firing an event with the status once the job is done,
+    or a failure once the deadline of the job (a Unix timestamp) has passed.
+    """
+
+    def __init__(
+        self,
+        job_id: str,
+        backend_classpath: str,
+        backend_kwargs: dict,
+        deadline: float,
+        poll_interval: float = 10.0,
+    ) -> None:
+        super().__init__()
+        self.job_id = job_id
+        self.backend_classpath = backend_classpath
+        self.backend_kwargs = backend_kwargs
+        self.deadline = deadline
+        self.poll_interval = poll_interval
+
+    def serialize(self) -> tuple[str, dict[str, Any]]:
+        return (
+            'custom_operators.dbt_jobs.DBTJobTrigger',
+            {
+                'job_id': self.job_id,
+                'backend_classpath': self.backend_classpath,
+                'backend_kwargs': self.backend_kwargs,
+                'deadline': self.deadline,
+                'poll_interval': self.poll_interval,
+            },
+        )
+
+    async def run(self) -> AsyncIterator[TriggerEvent]:
+        backend = import_string(self.backend_classpath)(**self.backend_kwargs)
+        while True:
+            status = await backend.get_status(self.job_id)
+            if status is not None:
+                yield TriggerEvent({'job_id': self.job_id, **status})
+                return
+
+            if time.time() > self.deadline:
+                yield TriggerEvent({
+                    'job_id': self.job_id,
+                    'success': False,
+                    'error': f"The dbt job {self.job_id} was still running past its deadline",
+                    'results': [],
+                })
+                return
+
+            self.log.debug("The dbt job %s is still running", self.job_id)
+            await asyncio.sleep(self.poll_interval)
+
+
+def send_heartbeats(job_path: Path, deadline: float, target_path: Path, done: threading.Event) -> None:
+    """Writes the heartbeat of the job until it's done, stopping the process if it's still running past its deadline."""
+    while not done.wait(HEARTBEAT_INTERVAL):
+        if time.time() > deadline:
+            write_json_atomically(
+                job_path / 'status.json',
+                {'success': False, 'error': "The dbt job was stopped past its deadline", 'results': []},
+            )
+            shutil.rmtree(target_path, ignore_errors=True)
+            os._exit(1)
+
+        write_json_atomically(job_path / 'heartbeat.json', time.time())
+
+
+def run_dbt_job(job_path: Path) -> bool:
+    """Runs the dbt invocation of a job submitted by the SubprocessDBTJobBackend, writing its status when done."""
+    done = threading.Event()
+    try:
+        # dbt is only imported when it's actually needed, since it's a heavy import
+        from dbt.cli.main import dbtRunner
+
+        job = json.loads((job_path / 'job.json').read_text())
+        with isolated_target_path(get_target_path(job['args'])) as target_path:
+            threading.Thread(
+                target=send_heartbeats,
+                args=(job_path, job['deadline'], target_path, done),
+                daemon=True,
+            ).start()
+
+            result = dbtRunner().invoke(set_target_path(job['args'], target_path))
+
+        status = {
+            'success': result.success,
+            'error': str(result.exception) if result.exception else get_node_errors(result),
+            'results': get_node_results(result),
+        }
+    except BaseException as error:
+        # The status is always written, otherwise the trigger would wait for the job until its heartbeat times out
+        write_json_atomically(job_path / 'status.json', {'success': False, 'error': repr(error), 'results': []})
+        raise
+    finally:
+        done.set()
+
+    write_json_atomically(job_path / 'status.json', status)
+    return status['success']
+
+
+if __name__ == '__main__':
+    sys.exit(0 if run_dbt_job(Path(sys.argv[1])) else 1)
@@ -0,0 +1,383 @@
+"""
+This module contains the Google Cloud Storage related custom operators and auxiliary classes.
+
+The data generation module (with NumPy, pandas and pyarrow) and the Google provider are only imported
+when the tasks run, so the DAG files that use these operators are parsed without importing any of them.
+"""
+import gzip
+import hashlib
+import io
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from airflow.models.baseoperator import BaseOperator
+
+from custom_operators.metrics import emit_metrics, get_queued_seconds
+
+if TYPE_CHECKING:
+    from scripts.generate_raw_data import BulkDataCreation
+
+
+# Chunk size of each part of the resumable uploads. It must be a multiple of 256 KiB.
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+
+# Version of the writers of this module (file formats, schemas and upload layout), which is part of the content key
+# of the uploaded objects along with the version of the generator, so changing either of them replaces the objects
+WRITER_VERSION = hashlib.sha256(Path(__file__).read_bytes()).hexdigest()[:16]
+
+# Time of day (UTC) of the scheduled runs of the challenge DAG, at which the data of each day is generated.
+# The range backfills generate every day at this time too, instead of the time they were triggered at,
+# so they reproduce the same data (and content keys) as the daily runs.
+DAILY_TIME_OF_DAY = '06:00:00+00:00'
+
+# Extension of the uploaded objects of each file format
+FILE_EXTENSIONS = {
+    'parquet': 'parquet',
+    'csv': 'csv.gz',
+}
+
+
+class LocalFilesystemBlobWriter(io.FileIO):
+    """
+    Writer of the LocalFilesystemBlob, which writes the object to a temporary file
+    and only replaces the object (along with its metadata) when closed, as the GCS uploads do.
+    """
+
+    def __init__(self, blob: 'LocalFilesystemBlob'):
+        self.blob = blob
+        blob.path.parent.mkdir(parents=True, exist_ok=True)
+        super().__init__(blob.path.with_name(f'.{blob.path.name}.tmp'), 'wb')
+
+    def close(self):
+        if self.closed:
+            return
+        super().close()
+        Path(self.name).replace(self.blob.path)
+        self.blob.metadata_path.write_text(json.dumps(self.blob.metadata or {}))
+
+
+class LocalFilesystemBlob:
+    """
+    Fake of google.cloud.storage.Blob that stores the object in the local filesystem.
+    The custom metadata of the object is stored in a hidden file next to it.
+    Only the subset of the API used by the custom operators is implemented.
+    """
+
+    def __init__(self, bucket: 'LocalFilesystemBucket', name: str):
+        self.bucket = bucket
+        self.name = name
+        self.path = bucket.path / name
+        self.metadata_path = self.path.with_name(f'.{self.path.name}.metadata.json')
+        self.metadata = None
+
+    def exists(self) -> bool:
+        return self.path.exists()
+
+    def reload(self):
+        self.metadata = json.loads(self.metadata_path.read_text()) if self.metadata_path.exists() else None
+
+    def open(self, mode: str = 'r', **kwargs):
+        if 'w' in mode:
+            return LocalFilesystemBlobWriter(self)
+        return open(self.path, mode)
+
+
+class LocalFilesystemBucket:
+    """Fake of google.cloud.storage.Bucket that maps the bucket to a local directory."""
+
+    def __init__(self, client: 'LocalFilesystemStorageClient', name: str):
+        self.client = client
+        self.name = name
+        self.path = client.root / name
+
+    def blob(self, blob_name: str) -> LocalFilesystemBlob:
+        return LocalFilesystemBlob(self, blob_name)
+
+    def get_blob(self, blob_name: str) -> LocalFilesystemBlob | None:
+        blob = self.blob(blob_name)
+        if not blob.exists():
+            return None
+        blob.reload()
+        return blob
+
+
+class LocalFilesystemStorageClient:
+    """
+    Fake of google.cloud.storage.Client backed by a local directory, where each bucket is a subdirectory.
+    It can be given to the operators in this module to run them without access to Google Cloud Storage.
+    """
+
+    def __init__(self, root: str | Path):
+        self.root = Path(root)
+
+    def bucket(self, bucket_name: str) -> LocalFilesystemBucket:
+        return LocalFilesystemBucket(self, bucket_name)
+
+
+class GenerateRawDataToGCSOperator(BaseOperator):
+    """
+    This operator generates the raw data and streams it straight to Google Cloud Storage,
+    without writing any local file.
+
+    The data is generated in batches of users and each table is written as a zstd-compressed Parquet file
+    (or a gzip-compressed CSV, with file_format='csv', which the landing tasks must then be given too)
+    to a resumable (multipart) upload, so only one batch and one upload chunk per table are kept in memory.
+    The objects are written to <object_prefix>/raw_<table>/ds=<ds>/file.parquet,
+    with the ds column appended to every row, so it's populated when landing the data.
+    The Parquet files have the explicit schema of the raw tables, so the landing never needs to infer types.
+    The distributions of the data follow the workload profile (see WORKLOAD_PROFILES), e.g. 'skewed'
+    to benchmark the models with hot keys.
+
+    The generation is deterministic per ds, so the objects are tagged with the content key of the data
+    (see get_content_key) in their metadata. When all the objects of a day already have the same key
+    (e.g. on retries and reruns), the day is neither generated nor uploaded again.
+
+    By default only the ds of the run is generated. For range backfills, start_ds and end_ds can be given
+    instead: all the days are then generated by the same task and uploaded in parallel (by max_workers threads),
+    and the objects of each table are pushed to XCom (under the source_objects_<table> key) to be loaded at once.
+    The days are generated as of the given time_of_day (e.g. DAILY_TIME_OF_DAY), or the time of the run's ts
+    when not given, which is the trigger time of manual runs.
+
+    In micro-batch mode (with slice_hours), only the slice of the day that starts at the data interval start
+    of the run is generated (see create_bulk_data_slice), to <object_prefix>/raw_<table>/ds=<ds>/hour=<hour>/,
+    with the hour column populated. Otherwise, the hour column is null.
+    """
+
+    template_fields = ('bucket', 'object_prefix', 'start_ds', 'end_ds')
+
+    def __init__(
+        self,
+        bucket: str,
+        object_prefix: str = 'challenge_data',
+        number_of_users: int | None = None,
+        seed: int | None = None,
+        batch_size: int = 100_000,
+        start_ds: str | None = None,
+        end_ds: str | None = None,
+        max_workers: int = 4,
+        file_format: str = 'parquet',
+        workload_profile: str = 'uniform',
+        slice_hours: int | None = None,
+        time_of_day: str | None = None,
+        gcp_conn_id: str = 'google_cloud_default',
+        storage_client=None,
+        **kwargs
+    ) -> None:
+        super().__init__(**kwargs)
+        self.bucket = bucket
+        self.object_prefix = object_prefix
+        self.number_of_users = number_of_users
+        self.seed = seed
+        self.batch_size = batch_size
+        self.start_ds = start_ds
+        self.end_ds = end_ds
+        self.max_workers = max_workers
+        self.file_format = file_format
+        self.workload_profile = workload_profile
+        self.slice_hours = slice_hours
+        self.time_of_day = time_of_day
+        self.gcp_conn_id = gcp_conn_id
+        self.storage_client = storage_client
+
+    def get_storage_client(self):
+        """Returns the storage client given to the operator or, by default, the one from the GCS connection."""
+        if self.storage_client is not None:
+            return self.storage_client
+
+        from airflow.providers.google.cloud.hooks.gcs import GCSHook
+
+        return GCSHook(gcp_conn_id=self.gcp_conn_id).get_conn()
+
+    def get_object_name(self, table_name: str, ds: str, hour: int | None = None) -> str:
+        partition = f'ds={ds}' if hour is None else f'ds={ds}/hour={hour:02d}'
+        return f'{self.object_prefix}/raw_{table_name}/{partition}/file.{FILE_EXTENSIONS[self.file_format]}'
+
+    def get_content_key(self, bulk_data: 'BulkDataCreation', ds: str) -> str:
+        """Returns the content key of the objects of the day, which changes whenever their content would change."""
+        from scripts.generate_raw_data import get_content_key
+
+        return get_content_key(
+            ds=ds,
+            execution_datetime=bulk_data.execution_datetime,
+            number_of_users=bulk_data.number_of_users,
+            seed=self.seed,
+            batch_size=self.batch_size,
+            object_format=self.file_format,
+            writer_version=WRITER_VERSION,
+            profile=asdict(bulk_data.profile),
+            hour=bulk_data.hour,
+            slice_hours=self.slice_hours,
+        )
+
+    def upload_day(self, bucket, bulk_data: 'BulkDataCreation', ds: str) -> tuple[dict[str, int], dict[str, int], bool]:
+        """
+        Generates the data of one day and streams it to the day's objects, unless they already have its content.
+        Returns the number of rows generated and of uploaded (compressed) bytes of each table,
+        and whether the existing objects were kept.
+        """
+        from scripts.generate_raw_data import RAW_TABLE_NAMES
+
+        content_key = self.get_content_key(bulk_data, ds)
+        object_names = {table_name: self.get_object_name(table_name, ds, bulk_data.hour) for table_name in RAW_TABLE_NAMES}
+        existing_blobs = [bucket.get_blob(object_name) for object_name in object_names.values()]
+        if all(blob is not None and (blob.metadata or {}).get('content_key') == content_key for blob in existing_blobs):
+            self.log.info("The objects of %s already have the content %s, skipping the upload", ds, content_key)
+            return dict.fromkeys(RAW_TABLE_NAMES, 0), dict.fromkeys(RAW_TABLE_NAMES, 0), True
+
+        blobs = {table_name: bucket.blob(object_name) for table_name, object_name in object_names.items()}
+        for blob in blobs.values():
+            blob.metadata = {'content_key': content_key}
+
+        uploads = {
+            table_name: blob.open('wb', chunk_size=UPLOAD_CHUNK_SIZE, ignore_flush=True)
+            for table_name, blob in blobs.items()
+        }
+
+        if self.file_format == 'parquet':
+            rows = self.write_parquet(bulk_data, uploads)
+        else:
+            rows = self.write_csv(bulk_data, uploads, ds)
+
+        # The uploads are only closed (and therefore committed) once all the data was generated,
+        # so a failure midway never leaves a partial object in the bucket.
+        uploaded_bytes = {}
+        for table_name in RAW_TABLE_NAMES:
+            uploaded_bytes[table_name] = uploads[table_name].tell()
+            uploads[table_name].close()
+
+        for table_name in RAW_TABLE_NAMES:
+            self.log.info(
+                "Uploaded %s rows (%s compressed bytes) to gs://%s/%s",
+                rows[table_name],
+                uploaded_bytes[table_name],
+                self.bucket,
+                blobs[table_name].name,
+            )
+
+        return rows, uploaded_bytes, False
+
+    def write_parquet(self, bulk_data: 'BulkDataCreation', uploads: dict) -> dict[str, int]:
+        """
+        Writes the data of the day to the uploads as Parquet files, with one row group per batch.
+        The files have the explicit schema of each raw table, including the ds and hour columns.
+        Returns the number of rows written to each table.
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        from scripts.generate_raw_data import RAW_TABLE_NAMES, get_arrow_schema
+
+        schemas = {table_name: get_arrow_schema(table_name, with_landing_columns=True) for table_name in uploads}
+        writers = {
+            table_name: pq.ParquetWriter(upload, schemas[table_name], compression='zstd')
+            for table_name, upload in uploads.items()
+        }
+        ds_value = pa.scalar(bulk_data.execution_date, pa.date32())
+        hour_value = pa.scalar(bulk_data.hour, pa.int64())
+
+        rows = dict.fromkeys(RAW_TABLE_NAMES, 0)
+        for tables in bulk_data.iter_batches(self.batch_size, arrow=True):
+            for table_name, table in zip(RAW_TABLE_NAMES, tables):
+                table = table.append_column(schemas[table_name].field('ds'), pa.repeat(ds_value, table.num_rows))
+                table = table.append_column(schemas[table_name].field('hour'), pa.repeat(hour_value, table.num_rows))
+                writers[table_name].write_table(table)
+                rows[table_name] += table.num_rows
+
+        # Closing the writers only writes the footers, since the uploads aren't owned by them
+        for writer in writers.values():
+            writer.close()
+
+        return rows
+
+    def write_csv(self, bulk_data: 'BulkDataCreation', uploads: dict, ds: str) -> dict[str, int]:
+        """
+        Writes the data of the day to the uploads as gzip-compressed CSV files, with the ds and hour columns appended.
+        Returns the number of rows written to each table.
+        """
+        from scripts.generate_raw_data import RAW_TABLE_NAMES
+
+        # The gzip header has no file name nor timestamp, so the same data always creates the same object
+        compressed_streams = {
+            table_name: gzip.GzipFile(filename='', fileobj=upload, mode='wb', mtime=0)
+            for table_name, upload in uploads.items()
+        }
+
+        rows = dict.fromkeys(RAW_TABLE_NAMES, 0)
+        for batch_number, dataframes in enumerate(bulk_data.iter_batches(self.batch_size)):
+            for table_name, dataframe in zip(RAW_TABLE_NAMES, dataframes):
+                dataframe = dataframe.assign(ds=ds, hour=bulk_data.hour)
+                compressed_streams[table_name].write(dataframe.to_csv(header=batch_number == 0).encode())
+                rows[table_name] += len(dataframe)
+
+        for compressed_stream in compressed_streams.values():
+            compressed_stream.close()
+
+        return rows
+
+    def execute(self, context):
+        from scripts.generate_raw_data import RAW_TABLE_NAMES, create_bulk_data_range, create_bulk_data_slice
+
+        start_time = time.perf_counter()
+        bucket = self.get_storage_client().bucket(self.bucket)
+
+        if self.slice_hours:
+            # In micro-batch mode, the slice of the day that starts at the data interval start is generated
+            bulk_data = {
+                context['ds']: create_bulk_data_slice(
+                    context['ds'],
+                    context['data_interval_start'].hour,
+                    self.slice_hours,
+                    self.number_of_users,
+                    self.seed,
+                    profile=self.workload_profile,
+                )
+            }
+        else:
+            # The days of the range are all created in one call and generated at the same time of day
+            bulk_data = create_bulk_data_range(
+                self.start_ds or context['ds'],
+                self.end_ds or context['ds'],
+                self.number_of_users,
+                self.seed,
+                time_of_day=self.time_of_day or context['ts'].split('T', 1)[1],
+                profile=self.workload_profile,
+            )
+
+        # Each day is generated and uploaded by its own thread. The compression and the uploads,
+        # which take most of the time, release the GIL, so the days are effectively processed in parallel.
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            day_results = list(executor.map(
+                lambda ds: self.upload_day(bucket, bulk_data[ds], ds),
+                bulk_data,
+            ))
+
+        rows = {table_name: sum(x[0][table_name] for x in day_results) for table_name in RAW_TABLE_NAMES}
+        uploaded_bytes = {table_name: sum(x[1][table_name] for x in day_results) for table_name in RAW_TABLE_NAMES}
+
+        for table_name in RAW_TABLE_NAMES:
+            context['ti'].xcom_push(
+                key=f'source_objects_{table_name}',
+                value=[self.get_object_name(table_name, ds, bulk_data[ds].hour) for ds in bulk_data],
+            )
+
+        elapsed_seconds = time.perf_counter() - start_time
+        return {
+            table_name: emit_metrics(
+                'pre_loading',
+                table_name,
+                {
+                    'days_generated': len(bulk_data) - sum(x[2] for x in day_results),
+                    'days_skipped': sum(x[2] for x in day_results),
+                    'rows_generated': rows[table_name],
+                    'bytes_uploaded': uploaded_bytes[table_name],
+                    'elapsed_seconds': elapsed_seconds,
+                    'queued_seconds': get_queued_seconds(context),
+                },
+                context,
+            )
+            for table_name in RAW_TABLE_NAMES
+        }
@@ -0,0 +1,154 @@
+"""
+This module contains the auxiliary functions to collect the pipeline metrics and emit them
+both as StatsD metrics (through the Airflow Stats client) and to a local JSONL file.
+"""
+import datetime
+import json
+import os
+import tempfile
+from pathlib import Path
+
+from airflow.models.baseoperator import BaseOperator
+from airflow.models.dag import DAG
+from airflow.operators.python import PythonOperator
+from airflow.stats import Stats
+
+
+METRICS_PREFIX = 'ancient'
+METRICS_JSONL_PATH = Path(
+    os.environ.get('ANCIENT_METRICS_JSONL_PATH', Path(tempfile.gettempdir()) / 'ancient' / 'metrics.jsonl')
+)
+
+# Metrics of the dbt adapter response (from BigQuery) that are collected for each model
+DBT_ADAPTER_METRICS = ['rows_affected', 'bytes_processed', 'bytes_billed', 'slot_ms']
+
+
+def get_queued_seconds(context) -> float | None:
+    """Returns how long the task instance waited in the queue before starting to run."""
+    task_instance = context['ti']
+    if not task_instance.queued_dttm or not task_instance.start_date:
+        return None
+    return (task_instance.start_date - task_instance.queued_dttm).total_seconds()
+
+
+def summarize_dbt_results(results: list[dict]) -> list[dict]:
+    """
+    Extracts the metrics of each model from the dbt results, in the run_results.json format:
+    execution time, start and end of the execution step and the adapter metrics (rows and bytes).
+    """
+    summary = []
+    for result in results:
+        execute_timing = next((x for x in result.get('timing', []) if x['name'] == 'execute'), {})
+        adapter_response = result.get('adapter_response') or {}
+
+        model_metrics = {
+            'model': result['unique_id'].split('.')[-1],
+            'unique_id': result['unique_id'],
+            'status': str(result['status']),
+            'execution_time': result['execution_time'],
+            'started_at': str(execute_timing.get('started_at')) if execute_timing else None,
+            'completed_at': str(execute_timing.get('completed_at')) if execute_timing else None,
+        }
+        for metric in DBT_ADAPTER_METRICS:
+            model_metrics[metric] = adapter_response.get(metric)
+
+        summary.append(model_metrics)
+    return summary
+
+
+def emit_metrics(kind: str, name: str, metrics: dict, context) -> dict:
+    """
+    Emits the numeric metrics as StatsD gauges named <prefix>.<kind>.<name>.<metric>,
+    and appends a record with all the metrics to the JSONL sink.
+    Returns the record, so it can be pushed to XCom.
+    """
+    for metric, value in metrics.items():
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            Stats.gauge(f'{METRICS_PREFIX}.{kind}.{name}.{metric}', value)
+
+    record = {
+        'dag_id': context['dag'].dag_id,
+        'run_id': context['run_id'],
+        'task_id': context['ti'].task_id,
+        'kind': kind,
+        'name': name,
+        'emitted_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        **metrics,
+    }
+
+    METRICS_JSONL_PATH.parent.mkdir(parents=True, exist_ok=True)
+    with open(METRICS_JSONL_PATH, 'a') as metrics_file:
+        metrics_file.write(json.dumps(record, default=str) + '\n')
+
+    return record
+
+
+def emit_dbt_metrics(results: list[dict], context) -> list[dict]:
+    """Emits the metrics of each model of a dbt invocation, along with the queueing delay of the task."""
+    queued_seconds = get_queued_seconds(context)
+    return [
+        emit_metrics('dbt', model_metrics['model'], {**model_metrics, 'queued_seconds': queued_seconds}, context)
+        for model_metrics in summarize_dbt_results(results)
+    ]
+
+
+def critical_path_report(**context) -> list[dict]:
+    """
+    Builds the critical path of the DAG run: starting from the last task to finish, it walks back
+    through the upstream task that finished last, which is the one that held the downstream task back.
+    Each step has its duration, queueing delay and the metrics it pushed to XCom.
+    """
+    dag_run = context['dag_run']
+    dag = context['dag']
+    task_instances = {
+        task_instance.task_id: task_instance
+        for task_instance in dag_run.get_task_instances()
+        if task_instance.end_date and task_instance.task_id != context['ti'].task_id
+    }
+    if not task_instances:
+        return []
+
+    critical_path = []
+    current = max(task_instances.values(), key=lambda x: x.end_date)
+    while current:
+        critical_path.append({
+            'task_id': current.task_id,
+            'duration': current.duration,
+            'queued_seconds': (
+                (current.start_date - current.queued_dttm).total_seconds()
+                if current.queued_dttm and current.start_date else None
+            ),
+            'metrics': context['ti'].xcom_pull(task_ids=current.task_id),
+        })
+        upstream = [
+            task_instances[task_id]
+            for task_id in dag.get_task(current.task_id).upstream_task_ids
+            if task_id in task_instances
+        ]
+        current = max(upstream, key=lambda x: x.end_date) if upstream else None
+
+    critical_path.reverse()
+    for step in critical_path:
+        print(f"{step['task_id']}: {step['duration']}s (queued {step['queued_seconds']}s)")
+    return critical_path
+
+
+def create_critical_path_report_task(dag: DAG, end_task: BaseOperator) -> PythonOperator:
+    """
+    Creates the task that reports the critical path of the run, once all the other tasks are done,
+    even if some of them failed. It must be called after all the tasks of the DAG were created.
+
+    It's set downstream of every task but end_task, instead of after end_task, so end_task stays a leaf.
+    Airflow sets the state of the run from its leaf tasks, so the run still fails when any task failed.
+    """
+    critical_path_report_task = PythonOperator(
+        task_id='critical_path_report',
+        python_callable=critical_path_report,
+        trigger_rule='all_done',
+        dag=dag,
+    )
+    for task in dag.tasks:
+        if task not in (end_task, critical_path_report_task):
+            task >> critical_path_report_task
+
+    return critical_path_report_task
@@ -0,0 +1,86 @@
+"""
+This module contains the custom operator that exports the consumption reports to the serving cache.
+
+The serving cache module (with NumPy and pyarrow) and the Google provider are only imported when the task runs,
+so the DAG files that use this operator are parsed without importing any of them.
+"""
+import time
+
+from airflow.models.baseoperator import BaseOperator
+
+from custom_operators.metrics import emit_metrics, get_queued_seconds
+
+
+# Filters of the reports that require a partition filter, which also bound the history that is served
+REPORT_FILTERS = {
+    'report_user_daily_transactions': "transaction_date BETWEEN DATE_SUB(DATE '{ds}', INTERVAL 365 DAY) AND DATE '{ds}'",
+}
+
+
+class ExportReportsToServingCacheOperator(BaseOperator):
+    """
+    This operator snapshots the consumption reports into the serving cache (see scripts/serving_cache.py),
+    as a new version for the ds of the run, and publishes it once all the reports were exported.
+
+    The reports are read through the BigQuery Storage API as Arrow tables, so they're written
+    to the cache without any conversion. Returns the rows exported per report.
+
+    By default, the reports of SERVING_REPORTS are exported to SERVING_CACHE_PATH, which must be a location
+    shared with the serving processes, such as the data folder of the environment's bucket.
+    """
+
+    def __init__(
+        self,
+        project_id: str,
+        dataset: str = 'l5_consumption',
+        reports: dict[str, str] | None = None,
+        cache_path: str | None = None,
+        gcp_conn_id: str = 'google_cloud_default',
+        **kwargs
+    ) -> None:
+        super().__init__(**kwargs)
+        self.project_id = project_id
+        self.dataset = dataset
+        self.reports = reports
+        self.cache_path = cache_path
+        self.gcp_conn_id = gcp_conn_id
+
+    def get_report_query(self, report_name: str, ds: str) -> str:
+        query = f"SELECT * FROM `{self.project_id}.{self.dataset}.{report_name}`"
+        if report_name in REPORT_FILTERS:
+            query += f" WHERE {REPORT_FILTERS[report_name].format(ds=ds)}"
+        return query
+
+    def execute(self, context):
+        from airflow.providers.google.cloud.hooks.bigquery import BigQueryHook
+
+        from scripts.serving_cache import SERVING_REPORTS, get_serving_cache_path, publish_version
+
+        # Checked first, so a missing location fails the task before querying the reports
+        cache_path = get_serving_cache_path(self.cache_path)
+        start_time = time.perf_counter()
+        client = BigQueryHook(gcp_conn_id=self.gcp_conn_id).get_client(project_id=self.project_id)
+        reports = self.reports or SERVING_REPORTS
+
+        tables = {
+            report_name: client.query(self.get_report_query(report_name, context['ds'])).to_arrow()
+            for report_name in reports
+        }
+        version_path = publish_version(context['ds'], tables, reports, cache_path)
+        self.log.info("Published the serving cache version %s", version_path)
+
+        elapsed_seconds = time.perf_counter() - start_time
+        return {
+            report_name: emit_metrics(
+                'serving_export',
+                report_name,
+                {
+                    'rows_exported': table.num_rows,
+                    'bytes_exported': table.nbytes,
+                    'elapsed_seconds': elapsed_seconds,
+                    'queued_seconds': get_queued_seconds(context),
+                },
+                context,
+            )
+            for report_name, table in tables.items()
+        }
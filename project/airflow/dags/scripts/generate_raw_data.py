@@ -1,16 +1,36 @@
 """
 This module contains the functions to create the mock data and do the cleanup afterwards.
 """
+import hashlib
+import json
 import os
-from dataclasses import dataclass, asdict
+import random
+import resource
+import sys
+import time
+from collections.abc import Iterator
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, asdict, fields
 from datetime import date, datetime, timedelta
+from decimal import Decimal
 from random import randrange, choice, randint, sample
 from pathlib import Path
 
+import numpy as np
 import pandas as pd
+import pyarrow as pa
 
 DATA_LOCATION = Path(__file__).resolve().parent / 'random_data'
 
+# Global IDs are built as YYYYMMDD * ID_DAILY_CAPACITY + daily sequence number,
+# which still fits in an INT64 column while allowing up to 10 billion IDs per day.
+ID_DAILY_CAPACITY = 10**10
+
+RAW_TABLE_NAMES = ['users', 'user_preferences', 'transactions']
+
+# Version of the generator code, which is part of the content key of the generated data
+GENERATOR_VERSION = hashlib.sha256(Path(__file__).read_bytes()).hexdigest()[:16]
+
 # Default values for testing
 TODAY = datetime(2024, 12, 12)
 NOW = datetime(2024, 12, 12, 6, 0, 0)
@@ -38,10 +58,93 @@ class RawTransaction():
     id: int
     user_id: int
     transaction_date: date
-    amount: float
+    amount: Decimal
     type: str
 
 
+RAW_TABLE_DATACLASSES = {
+    'users': RawUser,
+    'user_preferences': RawUserPreference,
+    'transactions': RawTransaction,
+}
+
+# Columns appended to the files that are landed: the ds of the data and, in micro-batch mode,
+# the hour its slice of the day starts at, which is null for whole days
+LANDING_COLUMNS = [('ds', date), ('hour', int)]
+NULLABLE_COLUMNS = {'hour'}
+
+# Arrow and BigQuery types of the raw columns, by the type of the dataclass field.
+# Timestamps are UTC, so that they're loaded as TIMESTAMP instead of DATETIME.
+# Money is a decimal with cents, so that its sums are exact.
+ARROW_TYPES = {
+    int: pa.int64(),
+    float: pa.float64(),
+    Decimal: pa.decimal128(18, 2),
+    bool: pa.bool_(),
+    str: pa.string(),
+    date: pa.date32(),
+    datetime: pa.timestamp('us', tz='UTC'),
+}
+BIGQUERY_TYPES = {
+    int: 'INT64',
+    float: 'FLOAT64',
+    Decimal: 'NUMERIC',
+    bool: 'BOOL',
+    str: 'STRING',
+    date: 'DATE',
+    datetime: 'TIMESTAMP',
+}
+
+
+@dataclass(frozen=True)
+class WorkloadProfile():
+    """
+    Distributions of the data created by BulkDataCreation.
+    The default values are the uniform distributions of the legacy logic.
+
+    Transactions of returning users (created up to history_days before) reference the users each of those days
+    actually had (see get_history_number_of_users), so they always exist as long as the history was generated.
+    """
+    # Days of history the returning users can come from
+    history_days: int = 2
+    # Average number of transactions of returning users, per new user of the day
+    returning_transactions_per_user: float = 5.0
+    # How the returning transactions are spread over the users: 'uniform' or 'zipf',
+    # where a few (whale) users get most of the transactions, following the exponent
+    returning_activity: str = 'uniform'
+    zipf_exponent: float = 1.2
+    # Average number of preference changes of returning users, per new user of the day
+    preference_changes_per_user: float = 0.0
+    # Relative weight of each hour of the day (UTC) for the preference timestamps, which are then spread
+    # over the 24 hours before the run. If not set, they're uniform over the 3 hours before the run.
+    hourly_weights: tuple[float, ...] | None = None
+    # Transaction amounts: 'uniform' from 0.01 to 100.00, or 'lognormal' (heavy-tailed) with the given median and sigma
+    amount_distribution: str = 'uniform'
+    amount_median: float = 20.0
+    amount_sigma: float = 1.5
+    max_amount: float = 1_000_000.0
+
+
+# Share of the daily activity per hour (UTC): quiet nights, a lunch bump and an evening peak
+DIURNAL_HOURLY_WEIGHTS = (
+    2, 1, 1, 1, 1, 2, 3, 4, 5, 6, 6, 7,
+    8, 7, 6, 6, 7, 8, 10, 12, 13, 12, 8, 4,
+)
+
+WORKLOAD_PROFILES = {
+    'uniform': WorkloadProfile(),
+    # Hot keys and heavy tails, to benchmark the models under production-like skew
+    'skewed': WorkloadProfile(
+        history_days=3 * 365,
+        returning_transactions_per_user=20.0,
+        returning_activity='zipf',
+        preference_changes_per_user=0.5,
+        hourly_weights=DIURNAL_HOURLY_WEIGHTS,
+        amount_distribution='lognormal',
+    ),
+}
+
+
 class DataCreation:
     """This class contain extra logic to handle the data creation."""
 
@@ -118,7 +221,7 @@ class DataCreation:
             transaction_type = choice(['deposit', 'withdrawal'])
             multiplier = 1 if transaction_type == 'deposit' else -1
 
-            amount = multiplier * randint(1, 10000) / 100
+            amount = multiplier * Decimal(randint(1, 10000)) / 100
 
             if days_ago == 0:
                 transaction = RawTransaction(
@@ -166,35 +269,719 @@ class DataCreation:
         return user_info
 
 
-def generate_raw_data(save_locally: bool = False, **kwargs):
+class BulkDataCreation:
     """
-    Run the main logic for data creation on the 3 pre-determined tables for this challenge:
-    - User
-    - User Preference
-    - Transaction
+    This class is the vectorized counterpart of DataCreation.
+    Instead of creating one object per user, it generates whole columns of users,
+    user preferences and transactions at once using NumPy arrays.
+    """
+
+    def __init__(
+        self,
+        execution_date: date,
+        execution_datetime: datetime,
+        number_of_users: int,
+        names: list[str],
+        available_languages: list[str],
+        seed: int | np.random.SeedSequence | None = None,
+        transaction_id_stride: int = 1,
+        transaction_id_offset: int = 0,
+        profile: WorkloadProfile = WORKLOAD_PROFILES['uniform'],
+        first_user_number: int = 1,
+        slice_number_of_users: int | None = None,
+        hour: int | None = None,
+        history_number_of_users: np.ndarray | None = None,
+    ):
+        self.execution_date = execution_date
+        self.execution_datetime = execution_datetime
+        self.number_of_users = number_of_users
+        self.available_languages = np.array(available_languages)
+        self.rng = np.random.default_rng(seed)
+        self.profile = profile
+
+        # Number of users of each day of the history, indexed by days ago, which the returning users are sampled from.
+        # By default, every day of the history had the same number of users.
+        if history_number_of_users is None:
+            history_number_of_users = np.full(profile.history_days + 1, number_of_users)
+        self.history_number_of_users = np.asarray(history_number_of_users, dtype=np.int64)
+
+        # Transaction (and preference change) numbers are interleaved when multiple shards generate the same day,
+        # so that each shard gets a disjoint ID range regardless of how many transactions it creates.
+        self.transaction_id_stride = transaction_id_stride
+        self.transaction_id_offset = transaction_id_offset
+
+        # The users generated by default: all the users of the day or, for micro-batches,
+        # the users of the slice of the day starting at the given hour (see create_bulk_data_slice).
+        self.first_user_number = first_user_number
+        self.slice_number_of_users = number_of_users if slice_number_of_users is None else slice_number_of_users
+        self.hour = hour
+
+        # Names are synthesized by combining the shuffled first and last names available.
+        # The shuffling depends only on the execution date, so that all shards of the same day agree on it.
+        names_rng = np.random.default_rng(int(execution_date.strftime('%Y%m%d')))
+        self.first_names = names_rng.permutation(sorted({name.split(' ', 1)[0] for name in names}))
+        self.last_names = names_rng.permutation(sorted({name.split(' ', 1)[-1] for name in names}))
+
+        self.users = None
+        self.user_preferences = None
+        self.transactions = None
+
+    @staticmethod
+    def generate_global_ids(execution_date: date, numbers: np.ndarray) -> np.ndarray:
+        """
+        Generates global unique ids for the given execution date.
+        The sequence numbers must be lower than ID_DAILY_CAPACITY.
+        """
+        assert numbers.size == 0 or numbers.max() < ID_DAILY_CAPACITY, "Exceeded daily ID limit"
+        return int(execution_date.strftime('%Y%m%d')) * ID_DAILY_CAPACITY + numbers.astype(np.int64)
+
+    def __synthesize_names(self, numbers: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Synthesizes names that are unique within the execution date and emails that are globally unique.
+        Each daily sequence number maps to a distinct combination of first and last names,
+        and a counter is appended once all combinations are used.
+        """
+        index = numbers - 1
+        first = self.first_names[index % self.first_names.size]
+        last = self.last_names[(index // self.first_names.size) % self.last_names.size]
+        generation = index // (self.first_names.size * self.last_names.size)
+
+        names = np.char.add(np.char.add(first, ' '), last)
+        names = np.where(
+            generation > 0,
+            np.char.add(np.char.add(names, ' '), (generation + 1).astype(str)),
+            names,
+        )
+
+        ids = self.generate_global_ids(self.execution_date, numbers)
+        emails = np.char.add(np.char.add(np.char.lower(np.char.replace(names, ' ', '.')), '.'), ids.astype(str))
+        emails = np.char.add(emails, '@example.com')
+        return names, emails
+
+    def generate_user_datapoints(self, first_user_number: int = 1, number_of_users: int | None = None):
+        """
+        Generates the users and user preferences columns, as DataCreation.generate_user_datapoints does for one user.
+        By default all users of the day are generated, but a slice of the daily sequence can be given instead.
+        """
+        if number_of_users is None:
+            number_of_users = self.number_of_users
+
+        numbers = np.arange(first_user_number, first_user_number + number_of_users, dtype=np.int64)
+        user_ids = self.generate_global_ids(self.execution_date, numbers)
+        names, emails = self.__synthesize_names(numbers)
+
+        self.users = {
+            'id': user_ids,
+            'name': names,
+            'registration_date': np.full(number_of_users, np.datetime64(self.execution_date, 'D')),
+            'email': emails,
+        }
+
+        self.user_preferences = self.__generate_preferences(user_ids, user_ids)
+
+    def __generate_event_timestamps(self, size: int) -> np.ndarray:
+        """
+        Generates the timestamps of preference events before the execution datetime:
+        uniformly over the previous 3 hours or, with the hourly weights of the profile, over the previous 24 hours.
+        """
+        run_timestamp = np.datetime64(self.execution_datetime, 's')
+        if self.profile.hourly_weights is None:
+            event_offsets = self.rng.integers(0, 3 * 60 * 60, size, endpoint=True)
+            return run_timestamp - event_offsets.astype('timedelta64[s]')
+
+        # Each of the 24 one-hour slots before the run is weighted by its hour of the day
+        slot_hours = (self.execution_datetime.hour + np.arange(24)) % 24
+        slot_weights = np.asarray(self.profile.hourly_weights, dtype=float)[slot_hours]
+        slots = self.rng.choice(24, size, p=slot_weights / slot_weights.sum())
+        event_offsets = slots * 60 * 60 + self.rng.integers(0, 60 * 60, size)
+        return run_timestamp - np.timedelta64(24 * 60 * 60, 's') + event_offsets.astype('timedelta64[s]')
+
+    def __generate_preferences(self, ids: np.ndarray, user_ids: np.ndarray) -> dict[str, np.ndarray]:
+        """Generates the preference events columns with the given ids and users."""
+        size = ids.size
+        return {
+            'id': ids,
+            'user_id': user_ids,
+            'preferred_language': self.rng.choice(self.available_languages, size),
+            'notifications_enabled': self.rng.integers(0, 2, size).astype(bool),
+            'marketing_opt_in': self.rng.integers(0, 2, size).astype(bool),
+            'event_timestamp': self.__generate_event_timestamps(size),
+        }
+
+    def __sample_returning_users(self, size: int) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Samples users created in the previous days of the history, following the activity of the profile,
+        among the users each of those days had.
+        With the zipf activity, the users are ranked over the whole history (interleaving the days),
+        so the hottest users are spread over all days. Returns their global IDs and how many days ago they were created.
+        """
+        history_days = self.profile.history_days
+        history_number_of_users = self.history_number_of_users[1:history_days + 1]
+        if self.profile.returning_activity == 'zipf':
+            # The ranks go through the user numbers in order and, for each number, through the days that had
+            # that many users. Ordering the days by their number of users, those are always the first ones.
+            days_by_users = np.argsort(-history_number_of_users, kind='stable') + 1
+            sorted_number_of_users = np.sort(history_number_of_users)
+            days_per_number = history_days - np.searchsorted(
+                sorted_number_of_users, np.arange(1, sorted_number_of_users[-1] + 1)
+            )
+            ranks_per_number = np.cumsum(days_per_number)
+
+            ranks = (self.rng.zipf(self.profile.zipf_exponent, size) - 1) % ranks_per_number[-1]
+            numbers = np.searchsorted(ranks_per_number, ranks, side='right') + 1
+            days_ago = days_by_users[ranks - (ranks_per_number[numbers - 1] - days_per_number[numbers - 1])]
+        else:
+            days_ago = self.rng.integers(1, history_days, size, endpoint=True)
+            numbers = self.rng.integers(1, self.history_number_of_users[days_ago], endpoint=True)
+
+        date_numbers = np.array([
+            int((self.execution_date - timedelta(days=x)).strftime('%Y%m%d')) for x in range(history_days + 1)
+        ], dtype=np.int64)
+        return date_numbers[days_ago] * ID_DAILY_CAPACITY + numbers.astype(np.int64), days_ago
+
+    def __generate_amounts(self, size: int) -> np.ndarray:
+        """Generates positive transaction amounts, rounded to cents, following the distribution of the profile."""
+        if self.profile.amount_distribution == 'lognormal':
+            cents = self.rng.lognormal(np.log(self.profile.amount_median * 100), self.profile.amount_sigma, size)
+            return np.clip(np.round(cents), 1, self.profile.max_amount * 100) / 100
+        return self.rng.integers(1, 10000, size, endpoint=True) / 100
+
+    def generate_preference_changes(self, daily_preference_counter: int = 1) -> int:
+        """
+        Generates preference changes of returning users, following the profile, for the users generated last,
+        and appends them to the user preferences. Their IDs are numbered after the users of the day.
+        Returns the updated counter, so that the IDs are kept unique across multiple calls.
+        """
+        if not self.profile.preference_changes_per_user:
+            return daily_preference_counter
+
+        number_of_changes = self.rng.poisson(self.profile.preference_changes_per_user * self.users['id'].size)
+        user_ids, _ = self.__sample_returning_users(number_of_changes)
+
+        counters = np.arange(daily_preference_counter, daily_preference_counter + number_of_changes, dtype=np.int64)
+        numbers = self.number_of_users + (counters - 1) * self.transaction_id_stride + self.transaction_id_offset + 1
+        changes = self.__generate_preferences(self.generate_global_ids(self.execution_date, numbers), user_ids)
+
+        self.user_preferences = {
+            column: np.concatenate([values, changes[column]]) for column, values in self.user_preferences.items()
+        }
+        return daily_preference_counter + number_of_changes
+
+    def generate_transactions(self, daily_transaction_counter: int = 1) -> int:
+        """
+        Generates the transactions columns for the users generated last: for accounts created today (0 to 3 per user),
+        and also for accounts created in the previous days of the history, following the profile
+        (by default, 2.5 per user for each of the past 2 days, spread uniformly).
+        Returns the updated counter, so that the transaction IDs are kept unique across multiple calls.
+
+        Transactions from previous days reference users within the number of users each of those days had.
+        """
+        number_of_users = self.users['id'].size
+
+        today_counts = self.rng.integers(0, 4, number_of_users)
+        today_user_ids = np.repeat(self.users['id'], today_counts)
+
+        number_of_returning = self.rng.poisson(self.profile.returning_transactions_per_user * number_of_users)
+        returning_user_ids, days_ago = self.__sample_returning_users(number_of_returning)
+
+        user_ids = np.concatenate([today_user_ids, returning_user_ids])
+        transaction_dates = np.datetime64(self.execution_date, 'D') - np.concatenate([
+            np.zeros(today_user_ids.size, dtype=np.int64), days_ago
+        ]).astype('timedelta64[D]')
+        number_of_transactions = user_ids.size
+
+        is_deposit = self.rng.integers(0, 2, number_of_transactions).astype(bool)
+        amounts = self.__generate_amounts(number_of_transactions)
+
+        counters = np.arange(daily_transaction_counter, daily_transaction_counter + number_of_transactions, dtype=np.int64)
+        transaction_numbers = (counters - 1) * self.transaction_id_stride + self.transaction_id_offset + 1
+
+        self.transactions = {
+            'id': self.generate_global_ids(self.execution_date, transaction_numbers),
+            'user_id': user_ids,
+            'transaction_date': transaction_dates,
+            'amount': np.where(is_deposit, amounts, -amounts),
+            'type': np.where(is_deposit, 'deposit', 'withdrawal'),
+        }
+        return daily_transaction_counter + number_of_transactions
+
+    def to_dataframes(self) -> tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+        """Returns the generated columns as DataFrames indexed by id, in the same format as the legacy logic."""
+        return tuple(
+            pd.DataFrame(columns).set_index('id')
+            for columns in (self.users, self.user_preferences, self.transactions)
+        )
+
+    def to_arrow_tables(self) -> tuple[pa.Table, pa.Table, pa.Table]:
+        """
+        Returns the generated columns as Arrow tables, with the explicit schema of each raw table.
+        The amounts are generated as floats rounded to cents, which are cast exactly to decimals.
+        """
+        tables = []
+        for table_name, columns in zip(RAW_TABLE_NAMES, (self.users, self.user_preferences, self.transactions)):
+            schema = get_arrow_schema(table_name)
+            tables.append(pa.table(
+                {
+                    name: pa.array(values).cast(schema.field(name).type)
+                    if pa.types.is_decimal(schema.field(name).type) else values
+                    for name, values in columns.items()
+                },
+                schema=schema,
+            ))
+        return tuple(tables)
+
+    def iter_batches(
+        self,
+        batch_size: int,
+        first_user_number: int | None = None,
+        number_of_users: int | None = None,
+        arrow: bool = False,
+    ) -> Iterator[tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame] | tuple[pa.Table, pa.Table, pa.Table]]:
+        """
+        Generates the data of the day in batches of (at most) batch_size users,
+        so that only one batch needs to be kept in memory at a time.
+        By default all users of the day (or of the slice of the day) are generated,
+        but a slice of the daily sequence can be given instead.
+        The batches are DataFrames or, if arrow is set, Arrow tables.
+        """
+        if first_user_number is None:
+            first_user_number = self.first_user_number
+        if number_of_users is None:
+            number_of_users = self.slice_number_of_users
+
+        daily_transaction_counter = 1
+        daily_preference_counter = 1
+        last_user_number = first_user_number + number_of_users - 1
+        for batch_first_user_number in range(first_user_number, last_user_number + 1, batch_size):
+            self.generate_user_datapoints(
+                batch_first_user_number, min(batch_size, last_user_number - batch_first_user_number + 1)
+            )
+            daily_preference_counter = self.generate_preference_changes(daily_preference_counter)
+            daily_transaction_counter = self.generate_transactions(daily_transaction_counter)
+            yield self.to_arrow_tables() if arrow else self.to_dataframes()
+
+
+def get_raw_columns(table_name: str, with_landing_columns: bool = False) -> list[tuple[str, type]]:
+    """
+    Returns the name and type of each column of the raw table, from the fields of its dataclass.
+    The columns added to the files that are landed (ds and hour) can be included at the end.
+    """
+    columns = [(field.name, field.type) for field in fields(RAW_TABLE_DATACLASSES[table_name])]
+    if with_landing_columns:
+        columns.extend(LANDING_COLUMNS)
+    return columns
+
+
+def get_arrow_schema(table_name: str, with_landing_columns: bool = False) -> pa.Schema:
+    """Returns the Arrow schema of the raw table, with non-nullable columns except for the hour."""
+    return pa.schema([
+        pa.field(name, ARROW_TYPES[type_], nullable=name in NULLABLE_COLUMNS)
+        for name, type_ in get_raw_columns(table_name, with_landing_columns)
+    ])
+
+
+def get_bigquery_schema_fields(table_name: str) -> list[dict]:
+    """Returns the BigQuery schema of the landing table of the raw table, which includes the ds and hour columns."""
+    return [
+        {'name': name, 'type': BIGQUERY_TYPES[type_]}
+        for name, type_ in get_raw_columns(table_name, with_landing_columns=True)
+    ]
+
+
+def get_execution_dates(kwargs: dict) -> tuple[date, datetime]:
+    """
+    If it's run by Airflow, the ds and ts values will be populated and used.
+    Otherwise, uses the default values instead.
     """
-    # If it's run by Airflow, the ds and ts values will be populated and used.
-    # Otherwise, uses the default values instead.
     try:
         ds: str = kwargs['ds']
         ts: str = kwargs['ts']
     except KeyError:
-        execution_date = TODAY
-        execution_datetime = NOW
-    else:
-        execution_date = datetime.strptime(ds, '%Y-%m-%d').date()
-        execution_datetime = datetime.strptime(ts, '%Y-%m-%dT%H:%M:%S%z').replace(tzinfo=None)
+        return TODAY, NOW
 
-    # Counter that keeps increasing in order to keep the transaction ID unique
-    daily_transaction_counter = 1
+    execution_date = datetime.strptime(ds, '%Y-%m-%d').date()
+    # Parsed as ISO format, since the ts of manually triggered runs also has microseconds
+    execution_datetime = datetime.fromisoformat(ts).replace(tzinfo=None)
+    return execution_date, execution_datetime
 
-    # Getting predetermined values for creating names and selecting languages.
+
+def load_random_data() -> tuple[list[str], list[str]]:
+    """Gets the predetermined values for creating names and selecting languages."""
     with open(DATA_LOCATION / 'random_names.txt') as names_file:
         names = [x.replace('\n', '') for x in names_file.readlines()]
 
     with open(DATA_LOCATION / 'languages.txt') as lang_file:
         available_languages = [x.replace('\n', '') for x in lang_file.readlines()]
 
+    return names, available_languages
+
+
+def get_daily_number_of_users(execution_date: date, seed: int | None = None) -> int:
+    """Returns the random number of new users of the day (from 5 to 49, as in the legacy logic), drawn from its seed."""
+    return int(np.random.default_rng(get_day_seed_sequence(execution_date, seed)).integers(5, 50))
+
+
+def get_history_number_of_users(
+    execution_date: date,
+    history_days: int,
+    number_of_users: int | None = None,
+    seed: int | None = None,
+) -> np.ndarray:
+    """
+    Returns the number of new users of the execution date and of each of the previous days of the history,
+    indexed by days ago: the given number of users for every day, if set, or the random number each day got.
+    """
+    if number_of_users is not None:
+        return np.full(history_days + 1, number_of_users, dtype=np.int64)
+
+    return np.array([
+        get_daily_number_of_users(execution_date - timedelta(days=days_ago), seed)
+        for days_ago in range(history_days + 1)
+    ], dtype=np.int64)
+
+
+def create_bulk_data(
+    number_of_users: int | None = None,
+    seed: int | None = None,
+    random_data: tuple[list[str], list[str]] | None = None,
+    profile: str = 'uniform',
+    **kwargs
+) -> BulkDataCreation:
+    """
+    Creates the BulkDataCreation object for the execution date.
+    If the number of users is not set, a random amount between 5 and 49 is picked, as in the legacy logic.
+
+    The random generator is seeded from the execution date (and the seed, if given),
+    so the same day always gets the same data, even on retries and reruns.
+    The names and languages can be given, if already loaded by load_random_data.
+    The distributions of the data follow the given profile of WORKLOAD_PROFILES.
+    """
+    execution_date, execution_datetime = get_execution_dates(kwargs)
+    names, available_languages = random_data or load_random_data()
+    workload_profile = WORKLOAD_PROFILES[profile]
+    history_number_of_users = get_history_number_of_users(
+        execution_date, workload_profile.history_days, number_of_users, seed
+    )
+
+    return BulkDataCreation(
+        execution_date,
+        execution_datetime,
+        int(history_number_of_users[0]),
+        names,
+        available_languages,
+        get_day_seed_sequence(execution_date, seed),
+        profile=workload_profile,
+        history_number_of_users=history_number_of_users,
+    )
+
+
+def get_date_range(start_ds: str, end_ds: str) -> list[str]:
+    """Returns the dates (in the ds format) from start_ds to end_ds, both included."""
+    start_date = datetime.strptime(start_ds, '%Y-%m-%d').date()
+    end_date = datetime.strptime(end_ds, '%Y-%m-%d').date()
+    return [(start_date + timedelta(days=x)).isoformat() for x in range((end_date - start_date).days + 1)]
+
+
+def create_bulk_data_range(
+    start_ds: str,
+    end_ds: str,
+    number_of_users: int | None = None,
+    seed: int | None = None,
+    time_of_day: str = '06:00:00+00:00',
+    profile: str = 'uniform',
+) -> dict[str, BulkDataCreation]:
+    """
+    Creates the BulkDataCreation objects of every day in the range, keyed by ds, for range backfills.
+    Each day is created as create_bulk_data would for that day's run, but the name files are only loaded once.
+    The data itself is only generated when iterating over the batches of each day.
+    """
+    random_data = load_random_data()
+    return {
+        ds: create_bulk_data(number_of_users, seed, random_data, profile, ds=ds, ts=f'{ds}T{time_of_day}')
+        for ds in get_date_range(start_ds, end_ds)
+    }
+
+
+def create_bulk_data_slice(
+    ds: str,
+    hour: int,
+    slice_hours: int = 1,
+    number_of_users: int | None = None,
+    seed: int | None = None,
+    random_data: tuple[list[str], list[str]] | None = None,
+    profile: str = 'uniform',
+) -> BulkDataCreation:
+    """
+    Creates the BulkDataCreation object of a slice of the day, for micro-batches: the slice_hours hours
+    starting at the given hour, which must be a multiple of the slice length.
+
+    Each slice gets its share of the users of the day and, as the shards do, its own seed and interleaved
+    transaction IDs, so the slices are deterministic, never collide and cost proportionally to their length.
+    The data of the slice is generated as of its end.
+    """
+    if 24 % slice_hours or hour % slice_hours:
+        raise ValueError(f"The day can't be sliced in {slice_hours} hours slices starting at {hour}h")
+
+    execution_date = datetime.strptime(ds, '%Y-%m-%d').date()
+    names, available_languages = random_data or load_random_data()
+    day_seed_sequence = get_day_seed_sequence(execution_date, seed)
+    workload_profile = WORKLOAD_PROFILES[profile]
+    history_number_of_users = get_history_number_of_users(
+        execution_date, workload_profile.history_days, number_of_users, seed
+    )
+    number_of_users = int(history_number_of_users[0])
+
+    number_of_slices = 24 // slice_hours
+    slice_number = hour // slice_hours
+    slice_sizes = split_evenly(number_of_users, number_of_slices)
+
+    return BulkDataCreation(
+        execution_date,
+        datetime.combine(execution_date, datetime.min.time()) + timedelta(hours=hour + slice_hours),
+        number_of_users,
+        names,
+        available_languages,
+        day_seed_sequence.spawn(number_of_slices)[slice_number],
+        transaction_id_stride=number_of_slices,
+        transaction_id_offset=slice_number,
+        profile=workload_profile,
+        first_user_number=sum(slice_sizes[:slice_number]) + 1,
+        slice_number_of_users=slice_sizes[slice_number],
+        hour=hour,
+        history_number_of_users=history_number_of_users,
+    )
+
+
+def split_evenly(total: int, number_of_parts: int) -> list[int]:
+    """Splits the total in the given number of parts, with the first ones getting the remainder."""
+    return [total // number_of_parts + (1 if part < total % number_of_parts else 0) for part in range(number_of_parts)]
+
+
+def get_content_key(**parameters) -> str:
+    """
+    Returns the hash that identifies the data generated with the given parameters (e.g. the ds, seed and batch size).
+    Since the generation is deterministic, the same parameters and version of this module always create the same data,
+    so any output stored under the same key can be reused instead of being generated again.
+    """
+    content = json.dumps({'generator_version': GENERATOR_VERSION, **parameters}, sort_keys=True, default=str)
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+def generate_bulk_raw_data(
+    number_of_users: int | None = None,
+    seed: int | None = None,
+    **kwargs
+) -> tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """
+    Runs the vectorized data creation, returning the users, user preferences and transactions DataFrames.
+    """
+    bulk_data = create_bulk_data(number_of_users, seed, **kwargs)
+    bulk_data.generate_user_datapoints()
+    bulk_data.generate_preference_changes()
+    bulk_data.generate_transactions()
+    return bulk_data.to_dataframes()
+
+
+def get_day_seed_sequence(execution_date: date, seed: int | None = None) -> np.random.SeedSequence:
+    """
+    Derives the seed sequence for the execution date, optionally combined with a base seed.
+    Child sequences spawned from it are reproducible for a given date, seed and number of children.
+    """
+    day_number = int(execution_date.strftime('%Y%m%d'))
+    return np.random.SeedSequence(day_number if seed is None else [seed, day_number])
+
+
+def get_peak_rss_bytes() -> int:
+    """Returns the peak resident set size of the current process, in bytes."""
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports it in kilobytes, while macOS reports it in bytes
+    return peak_rss if sys.platform == 'darwin' else peak_rss * 1024
+
+
+def stream_raw_data(
+    batch_size: int = 100_000,
+    number_of_users: int | None = None,
+    seed: int | None = None,
+    output_dir: str | Path = '.',
+    **kwargs
+) -> dict:
+    """
+    Generates the raw data in batches of users and appends each batch straight to the raw files,
+    so the memory usage stays flat regardless of the number of users.
+    Returns the generation statistics: rows written per table, rows/sec and peak RSS.
+    """
+    bulk_data = create_bulk_data(number_of_users, seed, **kwargs)
+
+    start_time = time.perf_counter()
+    rows = write_batches(
+        bulk_data.iter_batches(batch_size),
+        {table_name: Path(output_dir) / f'raw_{table_name}.csv' for table_name in RAW_TABLE_NAMES},
+    )
+    elapsed_seconds = time.perf_counter() - start_time
+    stats = {
+        'rows': rows,
+        'elapsed_seconds': elapsed_seconds,
+        'rows_per_second': sum(rows.values()) / elapsed_seconds if elapsed_seconds else None,
+        'peak_rss_bytes': get_peak_rss_bytes(),
+    }
+    return stats
+
+
+def write_batches(
+    batches: Iterator[tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]],
+    output_paths: dict[str, Path],
+) -> dict[str, int]:
+    """
+    Appends each batch of DataFrames to the output file of its table, writing the header only once.
+    Returns the number of rows written per table.
+    """
+    rows = dict.fromkeys(RAW_TABLE_NAMES, 0)
+
+    output_files = {table_name: open(output_paths[table_name], 'w', newline='') for table_name in RAW_TABLE_NAMES}
+    try:
+        for batch_number, dataframes in enumerate(batches):
+            for table_name, dataframe in zip(RAW_TABLE_NAMES, dataframes):
+                dataframe.to_csv(output_files[table_name], header=batch_number == 0)
+                rows[table_name] += len(dataframe)
+    finally:
+        for output_file in output_files.values():
+            output_file.close()
+
+    return rows
+
+
+def generate_shard(
+    shard_number: int,
+    number_of_shards: int,
+    first_user_number: int,
+    number_of_users: int,
+    history_number_of_users: np.ndarray,
+    seed_sequence: np.random.SeedSequence,
+    batch_size: int,
+    output_dir: Path,
+    profile: str = 'uniform',
+    **kwargs
+) -> dict:
+    """
+    Generates one shard of the day: a contiguous range of users and its transactions,
+    which get every number_of_shards-th transaction ID, starting from the shard number.
+    Each table is written to its own part file under the ds= prefix.
+    """
+    execution_date, execution_datetime = get_execution_dates(kwargs)
+    names, available_languages = load_random_data()
+
+    bulk_data = BulkDataCreation(
+        execution_date,
+        execution_datetime,
+        int(history_number_of_users[0]),
+        names,
+        available_languages,
+        seed_sequence,
+        transaction_id_stride=number_of_shards,
+        transaction_id_offset=shard_number,
+        profile=WORKLOAD_PROFILES[profile],
+        history_number_of_users=history_number_of_users,
+    )
+
+    output_paths = {}
+    for table_name in RAW_TABLE_NAMES:
+        partition_dir = output_dir / f'raw_{table_name}' / f'ds={execution_date.strftime("%Y-%m-%d")}'
+        partition_dir.mkdir(parents=True, exist_ok=True)
+        output_paths[table_name] = partition_dir / f'file-{shard_number:04d}.csv'
+
+    rows = write_batches(bulk_data.iter_batches(batch_size, first_user_number, number_of_users), output_paths)
+    return {
+        'shard_number': shard_number,
+        'rows': rows,
+        'files': {table_name: str(path) for table_name, path in output_paths.items()},
+        'peak_rss_bytes': get_peak_rss_bytes(),
+    }
+
+
+def generate_sharded_raw_data(
+    number_of_shards: int | None = None,
+    number_of_users: int | None = None,
+    seed: int | None = None,
+    batch_size: int = 100_000,
+    output_dir: str | Path = '.',
+    profile: str = 'uniform',
+    **kwargs
+) -> dict:
+    """
+    Generates the raw data of the day split in shards that run in parallel on a process pool.
+    By default, there's one shard per CPU core.
+
+    Each shard gets a disjoint range of user and transaction IDs and its own seed, derived from the execution date,
+    so the output is byte-for-byte reproducible for a given seed and number of shards, making retries idempotent.
+    Returns the generation statistics, including the part files written by each shard.
+    """
+    execution_date, _ = get_execution_dates(kwargs)
+    day_seed_sequence = get_day_seed_sequence(execution_date, seed)
+
+    if number_of_shards is None:
+        number_of_shards = os.cpu_count() or 1
+
+    history_number_of_users = get_history_number_of_users(
+        execution_date, WORKLOAD_PROFILES[profile].history_days, number_of_users, seed
+    )
+    number_of_users = int(history_number_of_users[0])
+
+    # Only the execution dates are forwarded, since the Airflow context can't be sent to other processes
+    execution_kwargs = {key: kwargs[key] for key in ('ds', 'ts') if key in kwargs}
+
+    shard_sizes = split_evenly(number_of_users, number_of_shards)
+    shard_seed_sequences = day_seed_sequence.spawn(number_of_shards)
+
+    start_time = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=number_of_shards) as executor:
+        futures = []
+        first_user_number = 1
+        for shard_number, (shard_size, shard_seed_sequence) in enumerate(zip(shard_sizes, shard_seed_sequences)):
+            futures.append(executor.submit(
+                generate_shard,
+                shard_number,
+                number_of_shards,
+                first_user_number,
+                shard_size,
+                history_number_of_users,
+                shard_seed_sequence,
+                batch_size,
+                Path(output_dir),
+                profile,
+                **execution_kwargs,
+            ))
+            first_user_number += shard_size
+
+        shards = [future.result() for future in futures]
+    elapsed_seconds = time.perf_counter() - start_time
+
+    rows = {table_name: sum(shard['rows'][table_name] for shard in shards) for table_name in RAW_TABLE_NAMES}
+    stats = {
+        'rows': rows,
+        'elapsed_seconds': elapsed_seconds,
+        'rows_per_second': sum(rows.values()) / elapsed_seconds if elapsed_seconds else None,
+        'peak_rss_bytes': max(shard['peak_rss_bytes'] for shard in shards),
+        'shards': shards,
+    }
+    return stats
+
+
+def generate_legacy_raw_data(**kwargs) -> tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """
+    Runs the original, one object per user, data creation.
+    Its IDs are limited to 99 per day (see DataCreation), so it fails with "Exceeded daily ID limit"
+    on the days that get more than 99 transactions, which is the case on most days.
+    """
+    execution_date, execution_datetime = get_execution_dates(kwargs)
+
+    # Counter that keeps increasing in order to keep the transaction ID unique
+    daily_transaction_counter = 1
+
+    names, available_languages = load_random_data()
+
+    # The random module is seeded from the execution date, so reruns of the same day create the same data
+    random.seed(int(execution_date.strftime('%Y%m%d')))
+
     # Defines the number of new users and which names will be picked today
     number_of_new_users = randrange(5, 50)
     sampled_names = sample(names, number_of_new_users)
@@ -206,20 +993,13 @@ def generate_raw_data(save_locally: bool = False, **kwargs):
         user_data.generate_user_datapoints()
         daily_transaction_counter = user_data.generate_transactions(daily_transaction_counter)
         datapoints.append(user_data)
-        # Debug
-        # print(user_data)
-        # print()
 
     # Creating the DataFrames based on the datapoints created previously
     users_df = pd.DataFrame([asdict(x.user) for x in datapoints])
     users_df.set_index('id', inplace=True)
-    print("Users Dataframe:")
-    print(users_df)
 
     user_preferences_df = pd.DataFrame([asdict(x.user_preference) for x in datapoints])
     user_preferences_df.set_index('id', inplace=True)
-    print("Users Preferences Dataframe:")
-    print(user_preferences_df)
 
     all_transactions = []
     for user_group in datapoints:
@@ -228,13 +1008,47 @@ def generate_raw_data(save_locally: bool = False, **kwargs):
 
     transactions_df = pd.DataFrame([asdict(x) for x in all_transactions])
     transactions_df.set_index('id', inplace=True)
+
+    return (users_df, user_preferences_df, transactions_df)
+
+
+def generate_raw_data(
+    save_locally: bool = False,
+    number_of_users: int | None = None,
+    seed: int | None = None,
+    vectorized: bool = True,
+    batch_size: int | None = None,
+    **kwargs
+):
+    """
+    Run the main logic for data creation on the 3 pre-determined tables for this challenge:
+    - User
+    - User Preference
+    - Transaction
+
+    By default, the vectorized engine is used, which has no daily ID cap and
+    can generate production-scale volumes by setting the number of users.
+    When saving locally, setting the batch size streams the data to the files in batches of users,
+    keeping the memory usage bounded, and the generation statistics are returned.
+    """
+    if save_locally and vectorized and batch_size:
+        return stream_raw_data(batch_size, number_of_users, seed, **kwargs)
+
+    if vectorized:
+        users_df, user_preferences_df, transactions_df = generate_bulk_raw_data(number_of_users, seed, **kwargs)
+    else:
+        users_df, user_preferences_df, transactions_df = generate_legacy_raw_data(**kwargs)
+
+    print("Users Dataframe:")
+    print(users_df)
+    print("Users Preferences Dataframe:")
+    print(user_preferences_df)
     print("Transactions Dataframe:")
     print(transactions_df)
 
     if save_locally:
-        users_df.to_csv('raw_users.csv')
-        user_preferences_df.to_csv('raw_user_preferences.csv')
-        transactions_df.to_csv('raw_transactions.csv')
+        for table_name, dataframe in zip(RAW_TABLE_NAMES, (users_df, user_preferences_df, transactions_df)):
+            dataframe.to_csv(f'raw_{table_name}.csv')
     else:
         return (users_df, user_preferences_df, transactions_df)
 
@@ -244,7 +1058,7 @@ def remove_files(files: list[str] | None = None, **kwargs):
     Removes files generated by the generate_raw_data function.
     """
     if not files:
-        files = ['raw_users.csv', 'raw_user_preferences.csv', 'raw_transactions.csv']
+        files = [f'raw_{table_name}.csv' for table_name in RAW_TABLE_NAMES]
 
     for file in files:
         try:
@@ -0,0 +1,158 @@
+"""
+This module contains the serving cache of the consumption reports: a local, read-only snapshot of each report,
+stored as an uncompressed Arrow IPC (Feather) file sorted by its key. The files are memory-mapped without
+any decoding, so only the pages that are read are loaded, and the rows of one user are found by a binary search
+over the key column, in milliseconds and without querying the warehouse.
+
+The snapshots are versioned per ds. Each version is written to its own directory and then published
+by atomically swapping the `current` symlink, so readers always see a complete version.
+
+The cache is published by whichever worker runs the export and read by the serving processes, so it must be
+in a shared location (see SERVING_CACHE_PATH).
+
+Usage:
+    cache = ServingCache()
+    cache.get('report_user_activity_summary', user_id)
+"""
+import json
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.feather as feather
+
+
+# Where the serving cache is published, shared by all the workers and the serving processes: in Composer, the data
+# folder of the environment's bucket (e.g. /home/airflow/gcs/data/serving_cache), which the serving processes mount
+# with Cloud Storage FUSE. There's no default, since a worker-local directory would only have the versions
+# exported by that worker, out of reach of the serving processes.
+SERVING_CACHE_PATH = os.environ.get('ANCIENT_SERVING_CACHE_PATH')
+
+# Reports of the consumption level that are served, by the column they're looked up by
+SERVING_REPORTS = {
+    'report_new_users_last_30_days': 'id',
+    'report_user_activity_summary': 'id',
+    'report_user_daily_transactions': 'user_id',
+    'report_user_latest_preferences': 'id',
+}
+
+# Name of the symlink that points to the version being served
+CURRENT_VERSION_LINK = 'current'
+
+
+def get_serving_cache_path(root: str | Path | None = None) -> Path:
+    """Returns the given location of the serving cache or, by default, SERVING_CACHE_PATH, which must then be set."""
+    root = root or SERVING_CACHE_PATH
+    if not root:
+        raise ValueError(
+            "The serving cache location isn't set: ANCIENT_SERVING_CACHE_PATH must point to a location shared by the "
+            "workers and the serving processes (e.g. /home/airflow/gcs/data/serving_cache)"
+        )
+    return Path(root)
+
+
+def publish_version(
+    ds: str,
+    reports: dict[str, pa.Table],
+    key_columns: dict[str, str] = SERVING_REPORTS,
+    root: str | Path | None = None,
+    keep_versions: int = 3,
+) -> Path:
+    """
+    Writes the reports as a new version of the serving cache and publishes it, by pointing the current
+    version link to it. Only the latest versions are kept, since readers can still be using the previous ones.
+    Returns the directory of the new version.
+    """
+    root = get_serving_cache_path(root)
+    versions_path = root / 'versions'
+    versions_path.mkdir(parents=True, exist_ok=True)
+
+    # Each publication gets its own directory, so reruns of the same ds never touch a version being read
+    version_path = Path(tempfile.mkdtemp(dir=versions_path, prefix=f'ds={ds}.'))
+    manifest = {'ds': ds, 'reports': {}}
+    for report_name, table in reports.items():
+        key_column = key_columns[report_name]
+        # Written uncompressed and as a single record batch, so the whole file (and the key column) can be mapped
+        feather.write_feather(
+            table.sort_by(key_column),
+            version_path / f'{report_name}.arrow',
+            compression='uncompressed',
+            chunksize=max(table.num_rows, 1),
+        )
+        manifest['reports'][report_name] = {'key_column': key_column, 'rows': table.num_rows}
+    (version_path / 'manifest.json').write_text(json.dumps(manifest))
+
+    # The link is replaced atomically, so readers see either the previous or the new version
+    temporary_link = root / f'.{CURRENT_VERSION_LINK}.{version_path.name}'
+    temporary_link.symlink_to(version_path.relative_to(root), target_is_directory=True)
+    temporary_link.replace(root / CURRENT_VERSION_LINK)
+
+    # The versions are ordered by their manifest, since the directories of a bucket mount have no modification time.
+    # Versions without a manifest were never published, so they go first.
+    def get_published_time(path: Path) -> float:
+        manifest_path = path / 'manifest.json'
+        return manifest_path.stat().st_mtime if manifest_path.exists() else 0.0
+
+    for old_version_path in sorted(versions_path.iterdir(), key=get_published_time)[:-keep_versions]:
+        if old_version_path != version_path:
+            shutil.rmtree(old_version_path, ignore_errors=True)
+
+    return version_path
+
+
+class ServedReport:
+    """
+    A report of a version of the serving cache, memory-mapped and indexed by its sorted key column.
+    Since the file is uncompressed, the table and its key column are views of the mapped file, and nothing is copied.
+    """
+
+    def __init__(self, path: Path, key_column: str):
+        self.table = feather.read_table(path, memory_map=True)
+        self.key_column = key_column
+        self.keys = self.table[key_column].to_numpy()
+
+    def get(self, key) -> list[dict]:
+        """Returns the rows of the key, found by a binary search over the sorted keys."""
+        start = np.searchsorted(self.keys, key, side='left')
+        end = np.searchsorted(self.keys, key, side='right')
+        return self.table.slice(start, end - start).to_pylist()
+
+
+class ServingCache:
+    """
+    Lookup API of the serving cache. The reports of the current version are loaded on first use,
+    and the version is checked on every lookup, so a newly published version is picked up without restarting.
+    """
+
+    def __init__(self, root: str | Path | None = None):
+        self.root = get_serving_cache_path(root)
+        self.version_path = None
+        self.manifest = None
+        self.reports = {}
+
+    def refresh(self):
+        """Switches to the current version, if a new one was published since the last lookup."""
+        version_path = (self.root / CURRENT_VERSION_LINK).resolve(strict=True)
+        if version_path == self.version_path:
+            return
+
+        self.manifest = json.loads((version_path / 'manifest.json').read_text())
+        self.reports = {}
+        self.version_path = version_path
+
+    @property
+    def ds(self) -> str:
+        """The ds of the version being served."""
+        self.refresh()
+        return self.manifest['ds']
+
+    def get(self, report_name: str, key) -> list[dict]:
+        """Returns the rows of the report with the given key (e.g. the user id)."""
+        self.refresh()
+        if report_name not in self.reports:
+            key_column = self.manifest['reports'][report_name]['key_column']
+            self.reports[report_name] = ServedReport(self.version_path / f'{report_name}.arrow', key_column)
+        return self.reports[report_name].get(key)
@@ -0,0 +1,135 @@
+"""
+Parse-time benchmark of the DAG files, which fails when any of them exceeds the parsing budget.
+
+The scheduler's DAG processor imports every DAG file on each loop, so whatever a DAG file imports
+at module level is paid over and over, even if it's only needed when the tasks run.
+Each DAG file is imported in a new process (after Airflow itself, which the DAG processor already has loaded),
+measuring its import time, the memory it adds and the heavy modules it pulls in, which must only be
+imported inside the tasks (e.g. NumPy, pandas, pyarrow, dbt or the Google provider).
+
+The dbt manifest must have been created (with `dbt parse`) before, since the DAGs are built from it.
+
+Usage:
+    pip install -r project/requirements.txt
+    python project/benchmark/dag_parse_benchmark.py
+    python project/benchmark/dag_parse_benchmark.py --max-seconds 0.5 --max-memory-mib 32 --repeat 5
+"""
+import argparse
+import importlib.util
+import multiprocessing
+import resource
+import statistics
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+PROJECT_PATH = Path(__file__).resolve().parents[1]
+DAGS_PATH = PROJECT_PATH / 'airflow' / 'dags'
+
+# Modules that must never be imported while parsing a DAG file
+HEAVY_MODULES = ['numpy', 'pandas', 'pyarrow', 'dbt', 'google.cloud', 'airflow.providers.google']
+
+
+def get_peak_rss_bytes() -> int:
+    """
+    Returns the peak resident set size of the current process, in bytes.
+    It's not imported from the generator module, since that would import NumPy and pandas.
+    """
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports it in kilobytes, while macOS reports it in bytes
+    return peak_rss if sys.platform == 'darwin' else peak_rss * 1024
+
+
+def import_dag_file(dag_file: Path) -> dict:
+    """Imports the DAG file as the DAG processor does, measuring its import time, added memory and heavy modules."""
+    from airflow.models.dag import DAG
+
+    sys.path.insert(0, str(DAGS_PATH))
+    modules_before = set(sys.modules)
+    peak_rss_before = get_peak_rss_bytes()
+
+    start_time = time.perf_counter()
+    spec = importlib.util.spec_from_file_location(f'dag_parse_benchmark_{dag_file.stem}', dag_file)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    import_seconds = time.perf_counter() - start_time
+
+    imported_modules = set(sys.modules) - modules_before
+    return {
+        'dag_file': dag_file.name,
+        'dags': sum(isinstance(value, DAG) for value in vars(module).values()),
+        'import_seconds': import_seconds,
+        'added_memory_bytes': get_peak_rss_bytes() - peak_rss_before,
+        'heavy_modules': sorted(
+            heavy_module for heavy_module in HEAVY_MODULES
+            if any(x == heavy_module or x.startswith(f'{heavy_module}.') for x in imported_modules)
+        ),
+    }
+
+
+def measure_dag_file(dag_file: Path, repeat: int) -> dict:
+    """
+    Imports the DAG file the given number of times, each in a new process so nothing is cached in memory,
+    and returns the median import time along with the maximum added memory.
+    """
+    measurements = []
+    for _ in range(repeat):
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+            measurements.append(executor.submit(import_dag_file, dag_file).result())
+
+    return {
+        **measurements[0],
+        'import_seconds': statistics.median(x['import_seconds'] for x in measurements),
+        'added_memory_bytes': max(x['added_memory_bytes'] for x in measurements),
+    }
+
+
+def check_budget(measurement: dict, max_seconds: float, max_memory_mib: float) -> list[str]:
+    """Returns the reasons why the DAG file is over the parsing budget, if any."""
+    violations = []
+    if measurement['import_seconds'] > max_seconds:
+        violations.append(f"import took {measurement['import_seconds']:.2f}s (budget: {max_seconds:.2f}s)")
+    if measurement['added_memory_bytes'] > max_memory_mib * 2**20:
+        violations.append(
+            f"import added {measurement['added_memory_bytes'] / 2**20:.0f} MiB (budget: {max_memory_mib:.0f} MiB)"
+        )
+    if measurement['heavy_modules']:
+        violations.append(f"imported {', '.join(measurement['heavy_modules'])}")
+    return violations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument(
+        '--dag-files',
+        type=Path,
+        nargs='+',
+        default=None,
+        help="DAG files to measure. Defaults to every Python file in the DAGs folder",
+    )
+    parser.add_argument('--max-seconds', type=float, default=1.0, help="Import time budget of each DAG file")
+    parser.add_argument('--max-memory-mib', type=float, default=64, help="Memory budget of each DAG file")
+    parser.add_argument('--repeat', type=int, default=3, help="Number of imports of each DAG file")
+    args = parser.parse_args()
+
+    dag_files = args.dag_files or sorted(DAGS_PATH.glob('*.py'))
+
+    within_budget = True
+    for dag_file in dag_files:
+        measurement = measure_dag_file(dag_file.resolve(), args.repeat)
+        violations = check_budget(measurement, args.max_seconds, args.max_memory_mib)
+        within_budget = within_budget and not violations
+
+        print(
+            f"{measurement['dag_file']}: {measurement['dags']} DAGs, {measurement['import_seconds']:.3f}s, "
+            f"{measurement['added_memory_bytes'] / 2**20:.1f} MiB"
+            f"{' (OVER BUDGET: ' + '; '.join(violations) + ')' if violations else ''}"
+        )
+
+    if not within_budget:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
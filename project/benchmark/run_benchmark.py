@@ -0,0 +1,269 @@
+"""
+Scale-factor benchmark of the whole pipeline, using DuckDB as a local stand-in for BigQuery.
+
+For each scale factor, a few consecutive days are processed as the DAG would do it:
+the raw data is generated with scripts/generate_raw_data.py, loaded into the landing tables,
+and the dbt models of each level (l2 to l5) are run, incrementally after the first day.
+
+Every stage runs in its own process, so its wall time and peak memory are measured in isolation.
+The measurements are appended to a JSONL results file, tagged by run and git revision,
+so runs from different revisions can be compared with --baseline.
+
+Usage:
+    pip install -r project/benchmark/requirements.txt
+    python project/benchmark/run_benchmark.py --scale-factors 1 10 100 --days 3
+    python project/benchmark/run_benchmark.py --scale-factors 1 --baseline <run_id>
+"""
+import argparse
+import datetime
+import json
+import multiprocessing
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+PROJECT_PATH = Path(__file__).resolve().parents[1]
+DBT_PROJECT_PATH = PROJECT_PATH / 'dbt' / 'ancient'
+sys.path.insert(0, str(PROJECT_PATH / 'airflow' / 'dags'))
+
+from scripts.generate_raw_data import WORKLOAD_PROFILES, get_peak_rss_bytes, stream_raw_data  # noqa: E402
+
+
+# Daily number of new users of the scale factor 1. Around 6.5 transactions are created for each new user.
+SF1_USERS_PER_DAY = 10_000
+
+DBT_LEVELS = ['l2_source', 'l3_intermediate', 'l4_final', 'l5_consumption']
+
+RESULTS_PATH = Path(__file__).resolve().parent / 'results.jsonl'
+
+
+def get_database_path(workdir: Path) -> Path:
+    return workdir / 'benchmark.duckdb'
+
+
+def generate_stage(workdir: Path, ds: str, number_of_users: int, profile: str) -> int:
+    """Generates the raw files of the day, with the given workload profile. Returns the number of raw rows."""
+    output_dir = workdir / 'raw' / f'ds={ds}'
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    stats = stream_raw_data(
+        number_of_users=number_of_users,
+        output_dir=output_dir,
+        profile=profile,
+        ds=ds,
+        ts=f'{ds}T06:00:00+00:00',
+    )
+    return sum(stats['rows'].values())
+
+
+def load_stage(workdir: Path, ds: str) -> int:
+    """
+    Loads the raw files of the day into the landing tables, overwriting the day's rows,
+    as the landing tasks do with the day's partition. Returns the number of rows loaded.
+    """
+    import duckdb
+
+    rows = 0
+    with duckdb.connect(str(get_database_path(workdir))) as connection:
+        connection.execute("CREATE SCHEMA IF NOT EXISTS l1_landing")
+        for raw_file in sorted((workdir / 'raw' / f'ds={ds}').glob('raw_*.csv')):
+            table = f'l1_landing.{raw_file.stem}'
+            connection.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} AS "
+                f"SELECT *, DATE '{ds}' AS ds, CAST(NULL AS BIGINT) AS hour FROM read_csv_auto(?) LIMIT 0",
+                [str(raw_file)],
+            )
+            connection.execute(f"DELETE FROM {table} WHERE ds = DATE '{ds}'")
+            rows += connection.execute(
+                f"INSERT INTO {table} SELECT *, DATE '{ds}' AS ds, CAST(NULL AS BIGINT) AS hour FROM read_csv_auto(?)",
+                [str(raw_file)],
+            ).fetchone()[0]
+
+    return rows
+
+
+def get_dbt_error(result) -> str:
+    """
+    Returns the messages of the failed nodes of a dbtRunner invocation. The exception of the invocation
+    is only set when dbt itself failed, so it's None when the models failed (e.g. compilation errors).
+    """
+    node_errors = [
+        f"{node_result.node.unique_id}: {node_result.message}"
+        for node_result in getattr(result.result, 'results', None) or []
+        if node_result.status in ('error', 'fail')
+    ]
+    return '; '.join(node_errors) or str(result.exception)
+
+
+def dbt_stage(workdir: Path, ds: str, level: str, full_refresh: bool) -> int | None:
+    """Runs the dbt models of the level. Returns the rows affected, if reported by the adapter."""
+    os.environ['DBT_DUCKDB_PATH'] = str(get_database_path(workdir))
+    from dbt.cli.main import dbtRunner
+
+    args = [
+        'run',
+        '--project-dir', str(DBT_PROJECT_PATH),
+        '--profiles-dir', str(DBT_PROJECT_PATH),
+        '--target', 'benchmark',
+        '--target-path', str(workdir / 'target'),
+        '--select', f'challenge.{level}',
+        '--vars', json.dumps({'ds': ds}),
+    ]
+    if full_refresh:
+        args.append('--full-refresh')
+
+    result = dbtRunner().invoke(args)
+    if not result.success:
+        raise RuntimeError(f"dbt run failed for {level} on {ds}: {get_dbt_error(result)}")
+
+    rows_affected = [
+        node_result.adapter_response.get('rows_affected')
+        for node_result in result.result.results
+        if node_result.adapter_response
+    ]
+    rows_affected = [x for x in rows_affected if x is not None and x >= 0]
+    return sum(rows_affected) if rows_affected else None
+
+
+def measure(stage_function, *args) -> dict:
+    """Runs the stage, measuring its wall time and the peak memory of the process."""
+    start_time = time.perf_counter()
+    stage_rows = stage_function(*args)
+    return {
+        'wall_seconds': time.perf_counter() - start_time,
+        'peak_rss_bytes': get_peak_rss_bytes(),
+        'stage_rows': stage_rows,
+    }
+
+
+def run_stage(stage_function, *args) -> dict:
+    """Runs the stage in a new process, so that its peak memory isn't affected by the previous stages."""
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+        return executor.submit(measure, stage_function, *args).result()
+
+
+def get_git_revision() -> str | None:
+    result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=PROJECT_PATH, capture_output=True, text=True)
+    return result.stdout.strip() or None
+
+
+def run_benchmark(
+    scale_factors: list[int],
+    days: int,
+    start_date: datetime.date,
+    workdir: Path,
+    results_path: Path = RESULTS_PATH,
+    profile: str = 'uniform',
+) -> str:
+    """
+    Runs the benchmark for each scale factor, appending one record per day and stage to the results file.
+    The rows/sec of every stage is based on the raw rows of the day, so the stages can be compared.
+    Returns the run id.
+    """
+    run_id = datetime.datetime.now().strftime('%Y%m%dT%H%M%S')
+    git_revision = get_git_revision()
+
+    for scale_factor in scale_factors:
+        sf_workdir = workdir / f'sf{scale_factor}'
+        shutil.rmtree(sf_workdir, ignore_errors=True)
+        sf_workdir.mkdir(parents=True)
+
+        for day_number in range(days):
+            ds = (start_date + datetime.timedelta(days=day_number)).isoformat()
+            stages = [
+                ('generate', generate_stage, sf_workdir, ds, scale_factor * SF1_USERS_PER_DAY, profile),
+                ('load', load_stage, sf_workdir, ds),
+                *[(f'dbt_{level}', dbt_stage, sf_workdir, ds, level, day_number == 0) for level in DBT_LEVELS],
+            ]
+
+            raw_rows = None
+            for stage_name, stage_function, *args in stages:
+                measurement = run_stage(stage_function, *args)
+                if stage_name == 'generate':
+                    raw_rows = measurement['stage_rows']
+
+                record = {
+                    'run_id': run_id,
+                    'git_revision': git_revision,
+                    'scale_factor': scale_factor,
+                    'profile': profile,
+                    'ds': ds,
+                    'incremental': day_number > 0,
+                    'stage': stage_name,
+                    'raw_rows': raw_rows,
+                    'rows_per_second': raw_rows / measurement['wall_seconds'] if measurement['wall_seconds'] else None,
+                    **measurement,
+                }
+                print(
+                    f"SF{scale_factor} {ds} {stage_name}: {measurement['wall_seconds']:.2f}s, "
+                    f"{measurement['peak_rss_bytes'] / 2**20:.0f} MiB peak, {record['rows_per_second']:.0f} rows/s"
+                )
+                with open(results_path, 'a') as results_file:
+                    results_file.write(json.dumps(record) + '\n')
+
+    return run_id
+
+
+def compare_runs(results_path: Path, baseline_run_id: str, run_id: str, tolerance: float) -> bool:
+    """
+    Compares the total wall time of each scale factor and stage between two runs.
+    Returns False if any of them got slower than the tolerance allows.
+    """
+    totals = {}
+    with open(results_path) as results_file:
+        for line in results_file:
+            record = json.loads(line)
+            if record['run_id'] in (baseline_run_id, run_id):
+                key = (record['run_id'], record['scale_factor'], record['stage'])
+                totals[key] = totals.get(key, 0) + record['wall_seconds']
+
+    no_regressions = True
+    for (current_run_id, scale_factor, stage), wall_seconds in sorted(totals.items()):
+        if current_run_id != run_id or (baseline_run_id, scale_factor, stage) not in totals:
+            continue
+
+        ratio = wall_seconds / totals[(baseline_run_id, scale_factor, stage)]
+        regression = ratio > 1 + tolerance
+        no_regressions = no_regressions and not regression
+        print(f"SF{scale_factor} {stage}: {ratio:.2f}x the baseline{' (REGRESSION)' if regression else ''}")
+
+    return no_regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale-factors', type=int, nargs='+', default=[1, 10, 100])
+    parser.add_argument('--days', type=int, default=3, help="Number of consecutive days processed per scale factor")
+    parser.add_argument(
+        '--start-date',
+        type=datetime.date.fromisoformat,
+        default=None,
+        help="First day processed. Defaults to the most recent days, so the last 30 days reports aren't empty",
+    )
+    parser.add_argument(
+        '--profile',
+        choices=sorted(WORKLOAD_PROFILES),
+        default='uniform',
+        help="Workload profile of the generated data, e.g. skewed to benchmark the models under hot-key skew",
+    )
+    parser.add_argument('--workdir', type=Path, default=Path(tempfile.gettempdir()) / 'ancient_benchmark')
+    parser.add_argument('--results', type=Path, default=RESULTS_PATH)
+    parser.add_argument('--baseline', help="Run id to compare the wall times against")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="Allowed slowdown over the baseline")
+    args = parser.parse_args()
+
+    start_date = args.start_date or datetime.date.today() - datetime.timedelta(days=args.days)
+    run_id = run_benchmark(args.scale_factors, args.days, start_date, args.workdir, args.results, args.profile)
+    print(f"Results of run {run_id} appended to {args.results}")
+
+    if args.baseline and not compare_runs(args.results, args.baseline, run_id, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+/*
+Compares the bytes scanned and billed by each model before and after a change in the physical layout
+(e.g. the partitioning and clustering of the models), using the job labels added by dbt.
+
+Compile it with the date of the change, then run the compiled query in BigQuery:
+    dbt compile --select analysis:bytes_scanned_by_model --vars '{"layout_change_date": "2024-12-20"}'
+*/
+
+{% set layout_change_date = var('layout_change_date', none) %}
+
+WITH model_jobs AS (
+    SELECT
+        (SELECT value FROM UNNEST(labels) WHERE key = 'dbt_invocation_id') AS invocation_id,
+        REGEXP_EXTRACT(query, r'"node_id": "([^"]+)"') AS node_id,
+        DATE(creation_time) AS run_date,
+        total_bytes_processed,
+        total_bytes_billed,
+        total_slot_ms
+    FROM
+        `region-{{ target.location | lower }}`.INFORMATION_SCHEMA.JOBS
+    WHERE
+        creation_time >= TIMESTAMP_SUB(CURRENT_TIMESTAMP(), INTERVAL 60 DAY)
+        AND job_type = 'QUERY'
+        AND statement_type != 'SCRIPT'
+        AND EXISTS (SELECT 1 FROM UNNEST(labels) WHERE key = 'dbt_invocation_id')
+)
+
+SELECT
+    node_id,
+    {% if layout_change_date %}
+    run_date >= DATE '{{ layout_change_date }}' AS after_layout_change,
+    {% endif %}
+    COUNT(DISTINCT invocation_id) AS runs,
+    SUM(total_bytes_processed) / COUNT(DISTINCT invocation_id) AS avg_bytes_processed_per_run,
+    SUM(total_bytes_billed) / COUNT(DISTINCT invocation_id) AS avg_bytes_billed_per_run,
+    SUM(total_slot_ms) / COUNT(DISTINCT invocation_id) AS avg_slot_ms_per_run
+FROM
+    model_jobs
+WHERE
+    node_id IS NOT NULL
+GROUP BY
+    node_id
+    {% if layout_change_date %}
+    , after_layout_change
+    {% endif %}
+ORDER BY
+    node_id
+    {% if layout_change_date %}
+    , after_layout_change
+    {% endif %}
@@ -0,0 +1,125 @@
+{% macro test_partition_filter(node) -%}
+
+    {#-
+        A filter that restricts the tests of the model (or source) to the partitions written by the current run,
+        following its meta: test_partition_column is the column to filter on, and test_partition_start is where
+        the written partitions start, which is the first ds by default, or the oldest transaction date among
+        the transactions of the current ds (or range) with affected_transactions. In micro-batch mode, the tests are
+        further restricted to the rows of the slice through test_slice_column, the column with the hour of the slice
+        that wrote each row. Without meta, the whole table is tested, as it is after full refreshes (with the test_all_partitions var).
+    -#}
+    {%- set column = node.meta.get('test_partition_column') -%}
+    {%- if not column or var('test_all_partitions', false) -%}
+
+        1 = 1
+
+    {%- elif node.meta.get('test_partition_start') == 'affected_transactions' -%}
+
+        {{ column }} BETWEEN {{ affected_transactions_min_date() }} AND {{ current_ds() }}
+
+    {%- elif is_micro_batch() and node.meta.get('test_slice_column') -%}
+
+        {{ in_current_slice(column, node.meta.get('test_slice_column')) }}
+
+    {%- else -%}
+
+        {{ in_current_ds_range(column) }}
+
+    {%- endif -%}
+
+{%- endmacro %}
+
+
+{% macro batched_test_failures_expression(test) -%}
+
+    {#- The expression that counts the failing rows of a generic test, or none if the test isn't supported -#}
+    {%- set name = test.test_metadata.name -%}
+    {%- set kwargs = test.test_metadata.kwargs -%}
+    {%- set column = kwargs.get('column_name') -%}
+    {%- set condition = '(' ~ test.config.where ~ ')' if test.config.where else '1 = 1' -%}
+
+    {%- if test.test_metadata.namespace or not column -%}
+        {{ return(none) }}
+    {%- elif name == 'not_null' -%}
+        {{ return('SUM(CASE WHEN ' ~ condition ~ ' AND ' ~ column ~ ' IS NULL THEN 1 ELSE 0 END)') }}
+    {%- elif name == 'unique' -%}
+        {%- set value = 'CASE WHEN ' ~ condition ~ ' THEN ' ~ column ~ ' END' -%}
+        {{ return('COUNT(' ~ value ~ ') - COUNT(DISTINCT ' ~ value ~ ')') }}
+    {%- elif name == 'accepted_values' -%}
+        {%- set values = [] -%}
+        {%- for value in kwargs['values'] -%}
+            {%- do values.append(dbt.string_literal(value) if kwargs.get('quote', true) else value) -%}
+        {%- endfor -%}
+        {{ return('SUM(CASE WHEN ' ~ condition ~ ' AND ' ~ column ~ ' NOT IN (' ~ values | join(', ') ~ ') THEN 1 ELSE 0 END)') }}
+    {%- endif -%}
+
+    {{ return(none) }}
+
+{%- endmacro %}
+
+
+{% macro run_batched_tests(select) %}
+
+    {#-
+        Runs the generic tests of the models (and sources) of the selected level, e.g. l2_source,
+        restricted to the partitions written by the current run (see test_partition_filter).
+
+        Instead of one query per test, the tests of each model are combined into a single query,
+        which counts the failing rows of every test in one scan of the written partitions.
+        The not_null, unique and accepted_values tests are supported; any other test is reported
+        as not run, so it can be run with dbt test instead.
+    -#}
+    {%- if not execute -%}
+        {{ return(none) }}
+    {%- endif -%}
+
+    {%- set tests_by_node = {} -%}
+    {%- set unsupported_tests = [] -%}
+    {%- for test in graph.nodes.values() if test.resource_type == 'test' and test.depends_on.nodes | length == 1 -%}
+        {%- set node_id = test.depends_on.nodes[0] -%}
+        {%- set node = graph.nodes.get(node_id) or graph.sources.get(node_id) -%}
+        {%- if node and select in node.fqn -%}
+            {%- if batched_test_failures_expression(test) is none -%}
+                {%- do unsupported_tests.append(test.unique_id) -%}
+            {%- else -%}
+                {%- do tests_by_node.setdefault(node_id, []).append(test) -%}
+            {%- endif -%}
+        {%- endif -%}
+    {%- endfor -%}
+
+    {%- set failed_tests = [] -%}
+    {%- for node_id, tests in tests_by_node.items() -%}
+        {%- set node = graph.nodes.get(node_id) or graph.sources.get(node_id) -%}
+        {%- set test_query -%}
+            SELECT
+            {%- for test in tests %}
+                {{ batched_test_failures_expression(test) }} AS failures_{{ loop.index0 }}{{ ',' if not loop.last }}
+            {%- endfor %}
+            FROM {{ node.relation_name }}
+            WHERE {{ test_partition_filter(node) }}
+        {%- endset -%}
+
+        {%- set row = run_query(test_query).rows[0] -%}
+        {%- for test in tests -%}
+            {%- set failures = row[loop.index0] or 0 -%}
+            {%- if failures > 0 -%}
+                {%- set message = test.name ~ ': ' ~ failures ~ ' failing rows' -%}
+                {%- if test.config.severity | lower == 'warn' -%}
+                    {%- do exceptions.warn(message) -%}
+                {%- else -%}
+                    {%- do failed_tests.append(message) -%}
+                {%- endif -%}
+            {%- endif -%}
+        {%- endfor -%}
+        {{ log('Ran ' ~ tests | length ~ ' tests of ' ~ node.name ~ ' in one query', info=true) }}
+    {%- endfor -%}
+
+    {%- if unsupported_tests -%}
+        {%- do exceptions.warn('Tests not supported by the batched tests, which were not run: ' ~ unsupported_tests | join(', ')) -%}
+    {%- endif -%}
+
+    {%- if failed_tests -%}
+        {{ exceptions.raise_compiler_error('Failed tests of ' ~ select ~ ':\n' ~ failed_tests | join('\n')) }}
+    {%- endif -%}
+
+{% endmacro %}
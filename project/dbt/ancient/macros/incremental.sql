@@ -0,0 +1,126 @@
+{% macro current_ds() -%}
+
+    {#- The execution date being processed, passed by Airflow through the ds var. Defaults to the current date. -#}
+    {%- if var('ds', none) -%}
+
+        DATE '{{ var('ds') }}'
+
+    {%- else -%}
+
+        CURRENT_DATE
+
+    {%- endif -%}
+
+{%- endmacro %}
+
+
+{% macro first_ds() -%}
+
+    {#- The first execution date of the range being processed by range backfills, passed through the ds_start var. Defaults to the current ds. -#}
+    {%- if var('ds_start', none) -%}
+
+        DATE '{{ var('ds_start') }}'
+
+    {%- else -%}
+
+        {{ current_ds() }}
+
+    {%- endif -%}
+
+{%- endmacro %}
+
+
+{% macro in_current_ds_range(column='ds') -%}
+
+    {#- A filter that selects the partitions being processed: from ds_start to ds on range backfills, or only ds otherwise -#}
+    {%- if var('ds_start', none) -%}
+
+        {{ column }} BETWEEN {{ first_ds() }} AND {{ current_ds() }}
+
+    {%- else -%}
+
+        {{ column }} = {{ current_ds() }}
+
+    {%- endif -%}
+
+{%- endmacro %}
+
+
+{% macro current_ds_partitions() -%}
+
+    {#- The partitions being processed, as date literals, for the partitions config of insert_overwrite models -#}
+    {%- if not var('ds_start', none) or not var('ds', none) -%}
+        {{ return([current_ds()]) }}
+    {%- endif -%}
+
+    {%- set start_date = modules.datetime.date.fromisoformat(var('ds_start')) -%}
+    {%- set end_date = modules.datetime.date.fromisoformat(var('ds')) -%}
+    {%- set partitions = [] -%}
+    {%- for day_number in range((end_date - start_date).days + 1) -%}
+        {%- do partitions.append("DATE '" ~ (start_date + modules.datetime.timedelta(days=day_number)).isoformat() ~ "'") -%}
+    {%- endfor -%}
+    {{ return(partitions) }}
+
+{%- endmacro %}
+
+
+{% macro is_micro_batch() -%}
+
+    {#- Whether a slice of the day is being processed (micro-batch mode), which is the case when the hour var is given -#}
+    {{ return(var('hour', none) is not none) }}
+
+{%- endmacro %}
+
+
+{% macro current_hour() -%}
+
+    {#- The hour the slice being processed starts at, in micro-batch mode. It's null when whole days are processed. -#}
+    {%- if is_micro_batch() -%}
+
+        {{ var('hour') }}
+
+    {%- else -%}
+
+        CAST(NULL AS {{ dbt.type_int() }})
+
+    {%- endif -%}
+
+{%- endmacro %}
+
+
+{% macro in_current_slice(ds_column='ds', hour_column='hour') -%}
+
+    {#- A filter that selects the rows being processed: those of the slice in micro-batch mode, or of the ds (or range) otherwise -#}
+    {{ in_current_ds_range(ds_column) }}
+    {%- if is_micro_batch() %} AND {{ hour_column }} = {{ var('hour') }}{% endif -%}
+
+{%- endmacro %}
+
+
+{% macro ds_partitions_strategy() -%}
+
+    {#-
+        The incremental strategy of the models partitioned by ds: the partitions of the current ds (or range) are replaced,
+        except in micro-batch mode, where the rows of each slice are merged into the partition of the current ds.
+    -#}
+    {%- if target.type != 'bigquery' -%}
+        {{ return('delete+insert') }}
+    {%- elif is_micro_batch() -%}
+        {{ return('merge') }}
+    {%- else -%}
+        {{ return('insert_overwrite') }}
+    {%- endif -%}
+
+{%- endmacro %}
+
+
+{% macro ds_partitions_predicates() -%}
+
+    {#- The partition filter of the target of the micro-batch merges, so only the partition of the current ds is scanned -#}
+    {%- if ds_partitions_strategy() == 'merge' -%}
+        {{ return([in_current_ds_range('DBT_INTERNAL_DEST.ds')]) }}
+    {%- endif -%}
+
+    {{ return(none) }}
+
+{%- endmacro %}
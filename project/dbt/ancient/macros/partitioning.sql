@@ -0,0 +1,33 @@
+{% macro all_partitions(column='ds') -%}
+
+    {#- A filter that selects every partition, for full rebuilds of models reading tables that require a partition filter -#}
+    {{ column }} >= DATE '1970-01-01'
+
+{%- endmacro %}
+
+
+{% macro affected_transactions_min_date() -%}
+
+    {#-
+        The oldest transaction date among the transactions of the current ds (or range, or slice), rendered as a literal so that
+        it can be used to prune partitions. Since a transaction is never landed before it happens,
+        the transactions from that date onwards are all in the ds partitions from that date onwards.
+    -#}
+    {%- if execute -%}
+        {%- set min_date_query -%}
+            SELECT MIN(transaction_date) FROM {{ ref('transactions') }} WHERE {{ in_current_slice() }}
+        {%- endset -%}
+        {%- set min_date = run_query(min_date_query).columns[0].values()[0] -%}
+    {%- endif -%}
+
+    {%- if execute and min_date -%}
+
+        DATE '{{ min_date }}'
+
+    {%- else -%}
+
+        {{ first_ds() }}
+
+    {%- endif -%}
+
+{%- endmacro %}
@@ -1,5 +1,26 @@
 /*
 The transactions's table
+
+It's partitioned by the landing date, so incremental runs simply replace the partition of the current ds
+(or the partitions of the range, on range backfills), while in micro-batch mode the transactions of each slice
+are merged into the partition of the current ds. It's clustered by user, since it's mostly joined and aggregated by user. Queries must filter on ds.
 */
 
+{{
+    config(
+        unique_key='id',
+        incremental_strategy=ds_partitions_strategy(),
+        incremental_predicates=ds_partitions_predicates(),
+        partition_by={'field': 'ds', 'data_type': 'date'},
+        partitions=current_ds_partitions(),
+        cluster_by=['user_id'],
+        require_partition_filter=true,
+        on_schema_change='append_new_columns',
+    )
+}}
+
 SELECT * FROM {{ source('l1_landing', 'raw_transactions') }}
+{% if is_incremental() %}
+WHERE
+    {{ in_current_slice() }}
+{% endif %}
@@ -1,7 +1,119 @@
 /*
 The user preference's table
+
+It's kept as a slowly changing dimension (type 2): each preference is valid from its created_at until its updated_at,
+when the next preference of the user was created. Each preference has its version and the latest one of each user is flagged.
+
+On incremental runs, only the users with new preference events in the current ds (or slice, in micro-batch mode) are touched:
+their new preferences are appended after their latest preference, which is then closed.
+If the new events aren't newer than the user's latest preference (late events or a rerun of the same ds),
+that user's history is recomputed instead.
+
+It's partitioned by the date of the run that last changed each row, so downstream models read only the changed rows.
+In micro-batch mode, the hour of the slice that last changed each row is also kept.
 */
 
+{{
+    config(
+        unique_key='id',
+        partition_by={'field': 'last_updated_ds', 'data_type': 'date'},
+        cluster_by=['user_id'],
+        on_schema_change='append_new_columns',
+    )
+}}
+
+WITH
+{% if is_incremental() %}
+new_events AS (
+    SELECT *
+    FROM {{ source('l1_landing', 'raw_user_preferences') }}
+    WHERE {{ in_current_slice() }}
+),
+
+current_latest AS (
+    SELECT *
+    FROM {{ this }}
+    WHERE
+        is_latest_preference
+        AND user_id IN (SELECT user_id FROM new_events)
+),
+
+reprocessed_users AS (
+    SELECT new_events.user_id
+    FROM
+        new_events
+        JOIN current_latest
+            ON new_events.user_id = current_latest.user_id
+    GROUP BY
+        new_events.user_id
+    HAVING
+        MIN(new_events.event_timestamp) <= MAX(current_latest.created_at)
+),
+
+events AS (
+    -- The latest preference of each user is carried with its version, so the new ones are numbered after it
+    SELECT
+        id,
+        user_id,
+        preferred_language,
+        notifications_enabled,
+        marketing_opt_in,
+        created_at AS event_timestamp,
+        ds,
+        preference_version AS base_version
+    FROM
+        current_latest
+    WHERE
+        user_id NOT IN (SELECT user_id FROM reprocessed_users)
+
+    UNION ALL
+
+    SELECT
+        id,
+        user_id,
+        preferred_language,
+        notifications_enabled,
+        marketing_opt_in,
+        event_timestamp,
+        ds,
+        CAST(NULL AS {{ dbt.type_bigint() }}) AS base_version
+    FROM
+        new_events
+    WHERE
+        user_id NOT IN (SELECT user_id FROM reprocessed_users)
+
+    UNION ALL
+
+    SELECT
+        id,
+        user_id,
+        preferred_language,
+        notifications_enabled,
+        marketing_opt_in,
+        event_timestamp,
+        ds,
+        CAST(NULL AS {{ dbt.type_bigint() }}) AS base_version
+    FROM
+        {{ source('l1_landing', 'raw_user_preferences') }}
+    WHERE
+        user_id IN (SELECT user_id FROM reprocessed_users)
+)
+{% else %}
+events AS (
+    SELECT
+        id,
+        user_id,
+        preferred_language,
+        notifications_enabled,
+        marketing_opt_in,
+        event_timestamp,
+        ds,
+        CAST(NULL AS {{ dbt.type_bigint() }}) AS base_version
+    FROM
+        {{ source('l1_landing', 'raw_user_preferences') }}
+)
+{% endif %}
+
 SELECT
     id,
     user_id,
@@ -9,8 +121,14 @@ SELECT
     notifications_enabled,
     marketing_opt_in,
     event_timestamp AS created_at,
-    IFNULL(LEAD(event_timestamp) OVER preferences_window, event_timestamp) AS updated_at
+    IFNULL(LEAD(event_timestamp) OVER preferences_window, event_timestamp) AS updated_at,
+    IFNULL(MAX(base_version) OVER (PARTITION BY user_id), 1) + ROW_NUMBER() OVER preferences_window - 1 AS preference_version,
+    LEAD(event_timestamp) OVER preferences_window IS NULL AS is_latest_preference,
+    ds,
+    {{ current_ds() }} AS last_updated_ds,
+    {{ current_hour() }} AS last_updated_hour
 FROM
-    {{ source('l1_landing', 'raw_user_preferences') }}
+    events
 WINDOW
-    preferences_window AS (PARTITION BY user_id ORDER BY event_timestamp)
+    -- Events with the same timestamp are ordered by ID, so each of them gets its own version deterministically
+    preferences_window AS (PARTITION BY user_id ORDER BY event_timestamp, id)
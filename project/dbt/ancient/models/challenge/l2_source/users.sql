@@ -1,5 +1,25 @@
 /*
 The user's table
+
+It's partitioned by the landing date, so incremental runs simply replace the partition of the current ds
+(or the partitions of the range, on range backfills). In micro-batch mode, the users of each slice
+are merged into the partition of the current ds instead.
 */
 
+{{
+    config(
+        unique_key='id',
+        incremental_strategy=ds_partitions_strategy(),
+        incremental_predicates=ds_partitions_predicates(),
+        partition_by={'field': 'ds', 'data_type': 'date'},
+        partitions=current_ds_partitions(),
+        cluster_by=['id'],
+        on_schema_change='append_new_columns',
+    )
+}}
+
 SELECT * FROM {{ source('l1_landing', 'raw_users') }}
+{% if is_incremental() %}
+WHERE
+    {{ in_current_slice() }}
+{% endif %}
@@ -1,7 +1,21 @@
 /*
 This model combines the multiple transactions that happen in the same day into 1 row, by transaction type and user.
+
+It's partitioned by the transaction date. On incremental runs, only the transaction dates that received
+new transactions (in the current ds, or slice in micro-batch mode) are recomputed and their partitions replaced. The oldest of those dates is used to prune
+the partitions of the transactions table that are read.
 */
 
+{{
+    config(
+        unique_key=['user_id', 'transaction_date', 'type'],
+        incremental_strategy=('insert_overwrite' if target.type == 'bigquery' else 'delete+insert'),
+        partition_by={'field': 'transaction_date', 'data_type': 'date'},
+        cluster_by=['user_id'],
+        require_partition_filter=true,
+    )
+}}
+
 SELECT
     user_id,
     transaction_date,
@@ -9,6 +23,17 @@ SELECT
     SUM(ROUND(CAST(amount AS NUMERIC), 2)) AS total_daily_amount
 FROM
     {{ ref('transactions') }}
+WHERE
+{% if is_incremental() %}
+    ds >= {{ affected_transactions_min_date() }}
+    AND transaction_date IN (
+        SELECT transaction_date
+        FROM {{ ref('transactions') }}
+        WHERE {{ in_current_slice() }}
+    )
+{% else %}
+    {{ all_partitions() }}
+{% endif %}
 GROUP BY
     user_id,
     transaction_date,
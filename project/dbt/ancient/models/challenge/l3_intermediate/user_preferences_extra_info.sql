@@ -1,31 +1,28 @@
 /*
 This table adds relevant info to user_preference table
+
+The preference versions and the latest preference flag are maintained incrementally by the user_preferences model,
+so on incremental runs only the preferences touched by the current run or slice (new and closed ones) are merged.
 */
 
-WITH latest_preference AS (
-    SELECT
-        id,
-        MAX(updated_at) AS latest_date
-    FROM
-        {{ ref('user_preferences') }}
-    GROUP BY
-        id
-)
+-- New columns are added to the existing table on incremental runs, instead of requiring a full refresh
+{{ config(unique_key='id', cluster_by=['user_id'], on_schema_change='append_new_columns') }}
 
 SELECT
-    user_preferences.id,
-    user_preferences.user_id,
-    RANK() OVER preferences_window AS preference_version,
-    latest_preference.latest_date IS NOT NULL AS is_latest_preference,
-    user_preferences.preferred_language,
-    user_preferences.notifications_enabled,
-    user_preferences.marketing_opt_in,
-    user_preferences.created_at,
-    user_preferences.updated_at
+    id,
+    user_id,
+    preference_version,
+    is_latest_preference,
+    preferred_language,
+    notifications_enabled,
+    marketing_opt_in,
+    created_at,
+    updated_at,
+    last_updated_ds,
+    last_updated_hour
 FROM
-    {{ ref('user_preferences') }} user_preferences
-    LEFT JOIN latest_preference
-        ON user_preferences.id = latest_preference.id
-            AND user_preferences.updated_at = latest_preference.latest_date
-WINDOW
-    preferences_window AS (PARTITION BY user_id ORDER BY created_at)
+    {{ ref('user_preferences') }}
+{% if is_incremental() %}
+WHERE
+    {{ in_current_slice('last_updated_ds', 'last_updated_hour') }}
+{% endif %}
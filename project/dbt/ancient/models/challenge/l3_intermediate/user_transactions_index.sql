@@ -0,0 +1,112 @@
+/*
+This model keeps a compact index of each user's transactions: deposit recency and count,
+first and last transaction dates, and the deposit and withdrawal totals.
+
+On incremental runs, only the transactions of the current ds (or slice, in micro-batch mode) are aggregated
+and combined with the existing row of each user. If the current ds or slice was already processed for a user
+(a retry or a backfill), that user's row is recomputed from its whole history instead, so that reruns never double count.
+A null last processed hour means that the whole day was processed.
+*/
+
+{{ config(unique_key='user_id', cluster_by=['user_id'], on_schema_change='append_new_columns') }}
+
+{% set aggregations %}
+    MAX(IF(type = 'deposit', transaction_date, NULL)) AS last_deposit_date,
+    SUM(IF(type = 'deposit', 1, 0)) AS deposit_count,
+    MIN(transaction_date) AS first_transaction_date,
+    MAX(transaction_date) AS last_transaction_date,
+    SUM(IF(type = 'deposit', ROUND(CAST(amount AS NUMERIC), 2), 0)) AS total_deposit,
+    SUM(IF(type = 'withdrawal', ROUND(CAST(amount AS NUMERIC), 2), 0)) AS total_withdrawal,
+    MAX(ds) AS last_processed_ds,
+    MAX(IF(ds = {{ current_ds() }}, hour, NULL)) AS last_processed_hour
+{% endset %}
+
+{% if is_incremental() %}
+
+WITH new_transactions AS (
+    SELECT
+        user_id,
+        {{ aggregations }}
+    FROM
+        {{ ref('transactions') }}
+    WHERE
+        {{ in_current_slice() }}
+    GROUP BY
+        user_id
+),
+
+reprocessed_users AS (
+    SELECT new_transactions.user_id
+    FROM
+        new_transactions
+        JOIN {{ this }} current_index
+            ON new_transactions.user_id = current_index.user_id
+    WHERE
+{% if is_micro_batch() %}
+        current_index.last_processed_ds > {{ current_ds() }}
+        OR (
+            current_index.last_processed_ds = {{ current_ds() }}
+            AND IFNULL(current_index.last_processed_hour, 23) >= {{ current_hour() }}
+        )
+{% else %}
+        current_index.last_processed_ds >= {{ first_ds() }}
+{% endif %}
+),
+
+recomputed_users AS (
+    SELECT
+        user_id,
+        {{ aggregations }}
+    FROM
+        {{ ref('transactions') }}
+    WHERE
+        {{ all_partitions() }}
+        AND user_id IN (SELECT user_id FROM reprocessed_users)
+    GROUP BY
+        user_id
+)
+
+SELECT
+    new_transactions.user_id,
+    COALESCE(
+        GREATEST(current_index.last_deposit_date, new_transactions.last_deposit_date),
+        current_index.last_deposit_date,
+        new_transactions.last_deposit_date
+    ) AS last_deposit_date,
+    IFNULL(current_index.deposit_count, 0) + new_transactions.deposit_count AS deposit_count,
+    COALESCE(
+        LEAST(current_index.first_transaction_date, new_transactions.first_transaction_date),
+        new_transactions.first_transaction_date
+    ) AS first_transaction_date,
+    COALESCE(
+        GREATEST(current_index.last_transaction_date, new_transactions.last_transaction_date),
+        new_transactions.last_transaction_date
+    ) AS last_transaction_date,
+    IFNULL(current_index.total_deposit, 0) + new_transactions.total_deposit AS total_deposit,
+    IFNULL(current_index.total_withdrawal, 0) + new_transactions.total_withdrawal AS total_withdrawal,
+    new_transactions.last_processed_ds,
+    new_transactions.last_processed_hour
+FROM
+    new_transactions
+    LEFT JOIN {{ this }} current_index
+        ON new_transactions.user_id = current_index.user_id
+WHERE
+    new_transactions.user_id NOT IN (SELECT user_id FROM reprocessed_users)
+
+UNION ALL
+
+SELECT * FROM recomputed_users
+
+{% else %}
+
+SELECT
+    user_id,
+    {{ aggregations }}
+FROM
+    {{ ref('transactions') }}
+WHERE
+    {{ all_partitions() }}
+GROUP BY
+    user_id
+
+{% endif %}
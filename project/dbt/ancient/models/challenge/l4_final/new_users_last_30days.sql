@@ -2,16 +2,12 @@
 This report solves the following business question:
 
 "Write a query that returns all users who made a deposit in the last 30 days"
-*/
 
-WITH valid_user_ids AS (
-    SELECT DISTINCT user_id
-    FROM {{ ref('transactions') }}
-    WHERE
-        type = 'deposit'
-        AND transaction_date > DATE_SUB(CURRENT_DATE, INTERVAL 30 DAY)
-)
+Since users leave the 30 days window over time, this model is always fully rebuilt.
+It's served from the per-user transactions index, so its cost doesn't grow with the transactions history.
+*/
 
+{{ config(materialized='table') }}
 
 SELECT
     users.id,
@@ -20,4 +16,7 @@ SELECT
     users.email
 FROM
     {{ ref('users') }} users
-    JOIN valid_user_ids ON users.id = valid_user_ids.user_id
+    JOIN {{ ref('user_transactions_index') }} user_transactions_index
+        ON users.id = user_transactions_index.user_id
+WHERE
+    user_transactions_index.last_deposit_date > {{ dbt.dateadd('day', -30, 'CURRENT_DATE') }}
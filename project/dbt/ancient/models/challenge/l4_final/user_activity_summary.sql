@@ -1,15 +1,37 @@
 -- Create a new table that joins Users, Transactions, and UserPreferences on user_id, and write a script to insert data into this combined table.
 
+-- The transactions totals are read from the per-user transactions index.
+-- On incremental runs, only the users with new transactions, preferences or registrations
+-- (in the current ds, or slice in micro-batch mode) are recomputed and merged.
 
-WITH transactions_summary AS (
+-- The transactions and the user preferences are only read on incremental runs, so the dependencies are declared for dbt to infer them
+-- depends_on: {{ ref('transactions') }}
+-- depends_on: {{ ref('user_preferences') }}
+
+{{ config(unique_key=['id', 'preference_version'], cluster_by=['id']) }}
+
+WITH
+{% if is_incremental() %}
+affected_users AS (
+    SELECT user_id FROM {{ ref('transactions') }} WHERE {{ in_current_slice() }}
+    UNION ALL
+    SELECT user_id FROM {{ ref('user_preferences') }} WHERE {{ in_current_slice('last_updated_ds', 'last_updated_hour') }}
+    UNION ALL
+    SELECT id AS user_id FROM {{ ref('users') }} WHERE {{ in_current_slice() }}
+),
+{% endif %}
+
+transactions_summary AS (
     SELECT
         user_id,
-        SUM(IF(type = 'deposit', total_daily_amount, 0)) AS total_deposit,
-        SUM(IF(type = 'withdrawal', total_daily_amount, 0)) AS total_withdrawal
+        total_deposit,
+        total_withdrawal
     FROM
-        {{ ref('helper_user_daily_transactions') }}
-    GROUP BY
-        user_id
+        {{ ref('user_transactions_index') }}
+{% if is_incremental() %}
+    WHERE
+        user_id IN (SELECT user_id FROM affected_users)
+{% endif %}
 )
 
 SELECT
@@ -2,8 +2,24 @@
 This report solves the following business question:
 
 "Write a query that sums transaction amounts by date and user, with separate columns for deposits and withdrawals (withdrawals should be negative)."
+
+It's partitioned by the transaction date. On incremental runs, only the transaction dates that received
+new transactions (in the current ds, or slice in micro-batch mode) are recomputed and their partitions replaced.
 */
 
+-- The transactions are only read on incremental runs, so the dependency is declared for dbt to infer it
+-- depends_on: {{ ref('transactions') }}
+
+{{
+    config(
+        unique_key=['user_id', 'transaction_date'],
+        incremental_strategy=('insert_overwrite' if target.type == 'bigquery' else 'delete+insert'),
+        partition_by={'field': 'transaction_date', 'data_type': 'date'},
+        cluster_by=['user_id'],
+        require_partition_filter=true,
+    )
+}}
+
 SELECT
     user_id,
     transaction_date,
@@ -11,6 +27,17 @@ SELECT
     SUM(IF(type = 'withdrawal', total_daily_amount, 0)) AS total_withdrawal
 FROM
     {{ ref('helper_user_daily_transactions') }}
+WHERE
+{% if is_incremental() %}
+    transaction_date >= {{ affected_transactions_min_date() }}
+    AND transaction_date IN (
+        SELECT transaction_date
+        FROM {{ ref('transactions') }}
+        WHERE {{ in_current_slice() }}
+    )
+{% else %}
+    {{ all_partitions('transaction_date') }}
+{% endif %}
 GROUP BY
     user_id,
     transaction_date
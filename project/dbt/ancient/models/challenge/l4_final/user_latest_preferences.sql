@@ -2,8 +2,24 @@
 This report solves the following business question:
 
 "Write a query that shows all users along with their latest preferences."
+
+On incremental runs, only the users with new preferences or registrations
+(in the current ds, or slice in micro-batch mode) are recomputed and merged.
 */
 
+-- The user preferences are only read on incremental runs, so the dependency is declared for dbt to infer it
+-- depends_on: {{ ref('user_preferences') }}
+
+{{ config(unique_key='id', cluster_by=['id']) }}
+
+{% if is_incremental() %}
+WITH affected_users AS (
+    SELECT user_id FROM {{ ref('user_preferences') }} WHERE {{ in_current_slice('last_updated_ds', 'last_updated_hour') }}
+    UNION ALL
+    SELECT id AS user_id FROM {{ ref('users') }} WHERE {{ in_current_slice() }}
+)
+{% endif %}
+
 SELECT
     users.id,
     users.name,
@@ -20,3 +36,6 @@ FROM
         ON users.id = user_preferences_extra_info.user_id
 WHERE
     user_preferences_extra_info.is_latest_preference
+{% if is_incremental() %}
+    AND users.id IN (SELECT user_id FROM affected_users)
+{% endif %}
@@ -1,3 +1,6 @@
+-- This view only projects the final table, so filters on transaction_date are pushed down and prune its partitions.
+-- Since the final table requires a partition filter, queries on this view must filter on transaction_date.
+
 SELECT
     user_id,
     transaction_date,
@@ -0,0 +1,28 @@
+"""
+The tests import the DAG modules (custom_operators and scripts) as Airflow does,
+from the DAGs folder, so it's added to the import path.
+
+The tests that run DAGs use a throwaway SQLite metadata database, set before Airflow is imported.
+"""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+DAGS_PATH = Path(__file__).resolve().parents[1] / 'airflow' / 'dags'
+sys.path.insert(0, str(DAGS_PATH))
+
+AIRFLOW_HOME = Path(tempfile.mkdtemp(prefix='ancient_tests_airflow_'))
+os.environ['AIRFLOW_HOME'] = str(AIRFLOW_HOME)
+os.environ['AIRFLOW__DATABASE__SQL_ALCHEMY_CONN'] = f'sqlite:///{AIRFLOW_HOME / "airflow.db"}'
+os.environ['AIRFLOW__CORE__LOAD_EXAMPLES'] = 'False'
+
+
+@pytest.fixture(scope='session')
+def airflow_db():
+    """Creates the metadata database, for the tests that run DAGs with dag.test()."""
+    from airflow.utils.db import initdb
+
+    initdb()
@@ -0,0 +1,72 @@
+import asyncio
+import time
+
+import pytest
+from airflow.exceptions import AirflowException
+from airflow.models.dag import DAG
+from airflow.utils.module_loading import import_string
+
+from custom_operators import dbt
+from custom_operators.dbt_graph import DBTModelNode, create_dbt_task_groups
+from custom_operators.dbt_jobs import DBTJobTrigger, LocalFakeDBTJobBackend, SubprocessDBTJobBackend
+
+
+def run_trigger(trigger: DBTJobTrigger) -> dict:
+    """Rebuilds the trigger from its serialized form, as the triggerer does, and returns the payload of its event."""
+    classpath, kwargs = trigger.serialize()
+
+    async def get_first_event():
+        async for event in import_string(classpath)(**kwargs).run():
+            return event.payload
+
+    return asyncio.run(get_first_event())
+
+
+@pytest.mark.parametrize('success', [True, False])
+def test_trigger_fires_the_job_status(tmp_path, success):
+    backend = LocalFakeDBTJobBackend(tmp_path, duration_seconds=0.1, success=success)
+    deadline = time.time() + 60
+    backend.submit('job', ['run'], deadline)
+
+    event = run_trigger(DBTJobTrigger('job', *backend.serialize(), deadline, poll_interval=0.05))
+    assert event['job_id'] == 'job'
+    assert event['success'] is success
+    assert (event['error'] is None) is success
+
+
+def test_trigger_fails_past_the_deadline(tmp_path):
+    backend = LocalFakeDBTJobBackend(tmp_path, duration_seconds=60)
+    deadline = time.time() + 0.1
+    backend.submit('job', ['run'], deadline)
+
+    event = run_trigger(DBTJobTrigger('job', *backend.serialize(), deadline, poll_interval=0.05))
+    assert not event['success']
+    assert 'deadline' in event['error']
+
+
+def test_jobs_need_a_shared_path():
+    with pytest.raises(AirflowException, match='ANCIENT_DBT_JOBS_PATH'):
+        SubprocessDBTJobBackend(jobs_path=None).submit('job', ['run'], time.time() + 60)
+
+
+def test_deferrable_tasks_need_a_shared_path_to_be_created(monkeypatch):
+    monkeypatch.setattr(dbt, 'DBT_JOBS_PATH', None)
+    with pytest.raises(AirflowException, match='ANCIENT_DBT_JOBS_PATH'):
+        dbt.DBTDeferrableOperator(task_id='model', select='model')
+
+
+def test_models_run_in_process_by_default():
+    graph = {
+        'model.ancient.model': DBTModelNode(
+            unique_id='model.ancient.model',
+            name='model',
+            level='l2_source',
+            select='challenge.l2_source.model',
+            depends_on=[],
+            sources=[],
+        ),
+    }
+    with DAG(dag_id='test_models_run_in_process_by_default', schedule=None):
+        tasks = create_dbt_task_groups(graph, {})
+
+    assert type(tasks['model.ancient.model']) is dbt.DBTInProcessOperator
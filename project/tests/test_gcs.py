@@ -0,0 +1,100 @@
+from types import SimpleNamespace
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from custom_operators import gcs, metrics
+from custom_operators.gcs import DAILY_TIME_OF_DAY, GenerateRawDataToGCSOperator, LocalFilesystemStorageClient
+from scripts.generate_raw_data import RAW_TABLE_NAMES
+
+DS = '2024-12-12'
+
+
+@pytest.fixture
+def context(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, 'METRICS_JSONL_PATH', tmp_path / 'metrics.jsonl')
+    ti = SimpleNamespace(task_id='generate', queued_dttm=None, start_date=None, xcom_push=lambda key, value: None)
+    return {'ds': DS, 'ts': f'{DS}T06:00:00+00:00', 'dag': SimpleNamespace(dag_id='challenge'), 'run_id': 'run', 'ti': ti}
+
+
+def create_operator(storage_root, **kwargs) -> GenerateRawDataToGCSOperator:
+    return GenerateRawDataToGCSOperator(
+        task_id='generate',
+        bucket='bucket',
+        number_of_users=100,
+        seed=1,
+        storage_client=LocalFilesystemStorageClient(storage_root),
+        **kwargs
+    )
+
+
+@pytest.mark.parametrize('file_format', ['parquet', 'csv'])
+def test_objects_have_every_generated_row(tmp_path, context, file_format):
+    operator = create_operator(tmp_path / 'gcs', file_format=file_format, batch_size=30)
+    table_metrics = operator.execute(context)
+
+    for table_name in RAW_TABLE_NAMES:
+        object_path = tmp_path / 'gcs' / 'bucket' / operator.get_object_name(table_name, DS)
+        table = pd.read_parquet(object_path) if file_format == 'parquet' else pd.read_csv(object_path)
+        assert len(table) == table_metrics[table_name]['rows_generated'] > 0
+        assert table['id'].is_unique
+        assert (table['ds'].astype(str) == DS).all()
+
+
+@pytest.mark.parametrize('file_format', ['parquet', 'csv'])
+def test_unchanged_uploads_are_skipped(tmp_path, context, file_format):
+    operator = create_operator(tmp_path / 'gcs', file_format=file_format)
+    object_paths = [
+        tmp_path / 'gcs' / 'bucket' / operator.get_object_name(table_name, DS) for table_name in RAW_TABLE_NAMES
+    ]
+
+    first_metrics = operator.execute(context)
+    assert all(x['days_generated'] == 1 and x['days_skipped'] == 0 for x in first_metrics.values())
+    contents = [path.read_bytes() for path in object_paths]
+    modification_times = [path.stat().st_mtime_ns for path in object_paths]
+
+    second_metrics = operator.execute(context)
+    assert all(x['days_generated'] == 0 and x['days_skipped'] == 1 for x in second_metrics.values())
+    assert all(x['bytes_uploaded'] == 0 for x in second_metrics.values())
+    assert [path.read_bytes() for path in object_paths] == contents
+    assert [path.stat().st_mtime_ns for path in object_paths] == modification_times
+
+
+def test_changed_uploads_are_replaced(tmp_path, context):
+    create_operator(tmp_path / 'gcs').execute(context)
+
+    changed_metrics = create_operator(tmp_path / 'gcs', batch_size=10).execute(context)
+    assert all(x['days_generated'] == 1 and x['days_skipped'] == 0 for x in changed_metrics.values())
+
+
+def test_changed_writers_replace_the_uploads(tmp_path, context, monkeypatch):
+    create_operator(tmp_path / 'gcs').execute(context)
+
+    monkeypatch.setattr(gcs, 'WRITER_VERSION', 'changed')
+    changed_metrics = create_operator(tmp_path / 'gcs').execute(context)
+    assert all(x['days_generated'] == 1 and x['days_skipped'] == 0 for x in changed_metrics.values())
+
+
+def test_backfills_reproduce_the_scheduled_runs(tmp_path, context):
+    create_operator(tmp_path / 'scheduled').execute(context)
+
+    backfill_context = {**context, 'ds': '2024-12-20', 'ts': '2024-12-20T15:23:11.123456+00:00'}
+    backfill_operator = create_operator(tmp_path / 'backfill', start_ds=DS, end_ds=DS, time_of_day=DAILY_TIME_OF_DAY)
+    backfill_operator.execute(backfill_context)
+
+    for table_name in RAW_TABLE_NAMES:
+        object_name = backfill_operator.get_object_name(table_name, DS)
+        scheduled_object = LocalFilesystemStorageClient(tmp_path / 'scheduled').bucket('bucket').get_blob(object_name)
+        backfill_object = LocalFilesystemStorageClient(tmp_path / 'backfill').bucket('bucket').get_blob(object_name)
+        assert backfill_object.path.read_bytes() == scheduled_object.path.read_bytes()
+        assert backfill_object.metadata == scheduled_object.metadata
+
+
+def test_parquet_amounts_are_decimals(tmp_path, context):
+    operator = create_operator(tmp_path / 'gcs')
+    operator.execute(context)
+
+    object_path = tmp_path / 'gcs' / 'bucket' / operator.get_object_name('transactions', DS)
+    assert pq.read_schema(object_path).field('amount').type == pa.decimal128(18, 2)
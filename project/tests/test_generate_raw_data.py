@@ -0,0 +1,97 @@
+from datetime import date, datetime, timedelta
+
+import pandas as pd
+import pytest
+
+from scripts.generate_raw_data import (
+    ID_DAILY_CAPACITY,
+    RAW_TABLE_NAMES,
+    WORKLOAD_PROFILES,
+    generate_bulk_raw_data,
+    generate_sharded_raw_data,
+    get_history_number_of_users,
+)
+
+DS = '2024-12-12'
+TS = f'{DS}T06:00:00+00:00'
+
+
+def get_user_number(user_id: int) -> tuple[date, int]:
+    """Splits a user ID (<yyyymmdd><number of the day>) into the date it was created on and its number."""
+    user_date, user_number = divmod(int(user_id), ID_DAILY_CAPACITY)
+    return datetime.strptime(str(user_date), '%Y%m%d').date(), user_number
+
+
+def read_shards(output_dir) -> dict[str, pd.DataFrame]:
+    return {
+        table_name: pd.concat(
+            pd.read_csv(path) for path in sorted((output_dir / f'raw_{table_name}').rglob('*.csv'))
+        )
+        for table_name in RAW_TABLE_NAMES
+    }
+
+
+@pytest.mark.parametrize('number_of_users', [None, 200])
+def test_returning_users_exist_in_the_history(number_of_users):
+    history_days = WORKLOAD_PROFILES['uniform'].history_days
+    execution_date = date.fromisoformat(DS)
+
+    user_ids = set()
+    for days_ago in range(history_days + 1):
+        ds = (execution_date - timedelta(days=days_ago)).isoformat()
+        users, _, _ = generate_bulk_raw_data(number_of_users, seed=1, ds=ds, ts=f'{ds}T06:00:00+00:00')
+        user_ids.update(users.index)
+
+    _, user_preferences, transactions = generate_bulk_raw_data(number_of_users, seed=1, ds=DS, ts=TS)
+    assert set(user_preferences['user_id']) <= user_ids
+    assert set(transactions['user_id']) <= user_ids
+
+
+def test_skewed_returning_users_exist_in_the_history():
+    profile = WORKLOAD_PROFILES['skewed']
+    execution_date = date.fromisoformat(DS)
+    history_number_of_users = get_history_number_of_users(execution_date, profile.history_days, seed=1)
+
+    _, user_preferences, transactions = generate_bulk_raw_data(seed=1, profile='skewed', ds=DS, ts=TS)
+    for user_id in set(user_preferences['user_id']) | set(transactions['user_id']):
+        user_date, user_number = get_user_number(user_id)
+        days_ago = (execution_date - user_date).days
+        assert 0 <= days_ago <= profile.history_days
+        assert 1 <= user_number <= history_number_of_users[days_ago]
+
+
+@pytest.mark.parametrize('profile', sorted(WORKLOAD_PROFILES))
+def test_ids_are_unique(profile):
+    users, user_preferences, transactions = generate_bulk_raw_data(500, seed=1, profile=profile, ds=DS, ts=TS)
+    assert users.index.is_unique
+    assert user_preferences.index.is_unique
+    assert transactions.index.is_unique
+
+
+def test_sharded_output_is_deterministic(tmp_path):
+    for run in ['first', 'second']:
+        generate_sharded_raw_data(
+            number_of_shards=3,
+            number_of_users=500,
+            seed=1,
+            batch_size=100,
+            output_dir=tmp_path / run,
+            ds=DS,
+            ts=TS,
+        )
+
+    first_files = sorted(path.relative_to(tmp_path / 'first') for path in (tmp_path / 'first').rglob('*.csv'))
+    second_files = sorted(path.relative_to(tmp_path / 'second') for path in (tmp_path / 'second').rglob('*.csv'))
+    assert len(first_files) == 3 * len(RAW_TABLE_NAMES)
+    assert first_files == second_files
+    for path in first_files:
+        assert (tmp_path / 'first' / path).read_bytes() == (tmp_path / 'second' / path).read_bytes()
+
+
+def test_shards_have_disjoint_ids(tmp_path):
+    generate_sharded_raw_data(number_of_shards=3, number_of_users=500, seed=1, output_dir=tmp_path, ds=DS, ts=TS)
+
+    tables = read_shards(tmp_path)
+    assert len(tables['users']) == 500
+    for table_name in RAW_TABLE_NAMES:
+        assert tables[table_name]['id'].is_unique
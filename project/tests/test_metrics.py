@@ -0,0 +1,31 @@
+import datetime
+
+import pytest
+from airflow.models.dag import DAG
+from airflow.operators.empty import EmptyOperator
+from airflow.operators.python import PythonOperator
+from airflow.utils.state import DagRunState, TaskInstanceState
+
+from custom_operators.metrics import create_critical_path_report_task
+
+
+def fail():
+    raise RuntimeError("Failed task")
+
+
+@pytest.mark.parametrize('python_callable, run_state', [(fail, DagRunState.FAILED), (lambda: None, DagRunState.SUCCESS)])
+def test_failed_task_fails_the_run(airflow_db, python_callable, run_state):
+    with DAG(
+        dag_id=f'test_critical_path_report_{run_state}',
+        start_date=datetime.datetime(2024, 12, 11),
+        schedule=None,
+    ) as dag:
+        start_task = EmptyOperator(task_id='start')
+        end_task = EmptyOperator(task_id='end')
+        start_task >> PythonOperator(task_id='load', python_callable=python_callable) >> end_task
+        create_critical_path_report_task(dag, end_task)
+
+    dag_run = dag.test()
+
+    assert dag_run.state == run_state
+    assert dag_run.get_task_instance('critical_path_report').state == TaskInstanceState.SUCCESS